@@ -1,117 +1,153 @@
 import heapq
-import time
-from pysat.formula import CNF, IDPool
-import tracemalloc
-from helper import (
-    get_island_info, generate_bridge,
-    add_main_contraints, add_island_contraints, 
-    add_non_crossing_constraints, check_connect,
-    get_n_vars, interpret_model
-)
-
-def solve_with_a_star(matrix):
+from helper import ConnectivityChecker, get_n_vars, interpret_model
+from encoding_cache import get_encoding
+from preprocess import residual_islands
+from instrument import Profile, Budget, run_search
+
+def solve_with_a_star(matrix, stats=None, profile=None, budget=None):
     """
     Solve Hashiwokakero applying A* algorithm and measure time.
+      stats: optional dictionary, filled with 'status', 'nodes' and 'expanded' (states taken from the open list),
+             'peak_frontier' (largest open list)
+      profile: optional instrument.Profile, filled with the time of each phase
+      budget: optional instrument.Budget, a new Budget() with the default limits when None
     """
-    start_time = time.perf_counter()
-    tracemalloc.start() 
+    if profile is None:
+        profile = Profile()
+    if budget is None:
+        budget = Budget()
+    profile.start()
+    budget.start()
+
+    if stats is None:
+        stats = {}
+    stats['expanded'] = 0
+    stats['peak_frontier'] = 0
 
-    islands = get_island_info(matrix)
-    bridges, coord_to_id = generate_bridge(islands, matrix)
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix, profile)
 
-    cnf = CNF()
-    vpool = IDPool()
+    with profile.phase('search'):
+        solution = run_search(lambda: search(cnf, islands, bridge_vars, fixed, stats, profile, budget), budget, stats)
 
-    bridge_vars = add_main_contraints(cnf, vpool, bridges)
-    add_island_contraints(cnf, vpool, islands, bridge_vars)
-    add_non_crossing_constraints(cnf, vpool, bridges)
+    elapsed, peak = profile.stop()
+    if solution is not None:
+        return solution, islands, bridges, elapsed, peak
+    return None, None, None, elapsed, peak
 
-    clauses = cnf.clauses
+def search(cnf, islands, bridge_vars, fixed, stats, profile, budget):
+    """
+    A* over partial assignments. g = number of assigned variables.
+    h = ceil(deficit / 2), deficit = bridges the islands still miss: one more True bridge variable
+    lowers it by 2, so h never overestimates the remaining steps.
+    Each child only re-evaluates the clauses and islands of the variable it assigns.
+      Output: solution: {(island_id_1, island_id_2) -> count}, or None if there is no connected model
+    """
     n = get_n_vars(cnf)
-    init = [None] * (n + 1)
-
-    def heuristic(assgn):
-        h = 0
-        for clause in clauses:
-            sat = False
-            for lit in clause:
-                if assgn[abs(lit)] is None:
-                    sat = True
-                    break
-                elif (lit > 0 and assgn[abs(lit)] is True) or (lit < 0 and assgn[abs(lit)] is False):
-                    sat = True
-                    break
-            if not sat:
-                h += 1
-        return h
+    # A state is two bitmasks over the variables: `assigned` (bit v set once v has a value) and `value`.
+    # Bit 0 is always set in `assigned` so the lowest zero bit is the next variable to assign.
+    full = (1 << (n + 1)) - 1
+    # occurrences[v]: (polarity of v, positive mask, negative mask, all literals mask) of every clause with v
+    occurrences = [[] for _ in range(n + 1)]
+    for clause in cnf.clauses:
+        if not clause:
+            return None
+        pos = neg = 0
+        for lit in clause:
+            if lit > 0:
+                pos |= 1 << lit
+            else:
+                neg |= 1 << -lit
+        for lit in set(clause):
+            occurrences[abs(lit)].append((lit > 0, pos, neg, pos | neg))
+
+    # Island side: what each island still needs beyond the fixed bridges, the bridge variables touching it,
+    # and the islands of each bridge variable
+    require = {id: req for id, (r, c, req) in residual_islands(islands, fixed).items()}
+    incident = {id: 0 for id in islands.keys()}
+    var_islands = {}
+    for (i, j), (x1, x2) in bridge_vars.items():
+        for x in (x1, x2):
+            var_islands[x] = (i, j)
+            incident[i] |= 1 << x
+            incident[j] |= 1 << x
+    for id, req in require.items():
+        if req > incident[id].bit_count():
+            return None
 
+    def decode(value):
+        return [None] + [bool(value >> v & 1) for v in range(1, n + 1)]
+
+    deficit0 = sum(require.values())
+    unsat0 = len(cnf.clauses)
     g0 = 0
-    h0 = heuristic(init)
+    h0 = (deficit0 + 1) // 2
     open_heap = []
-    heapq.heappush(open_heap, (g0 + h0, g0, init))
+    # Deeper states first among equal f, then the ones with fewer unsatisfied clauses
+    heapq.heappush(open_heap, (g0 + h0, -g0, unsat0, 1, 0, deficit0))
     closed = set()
+    checker = ConnectivityChecker(islands)
 
     while open_heap:
-        f, g, assgn = heapq.heappop(open_heap)
-        state_key = tuple(assgn)
+        f, neg_g, unsat, assigned, value, deficit = heapq.heappop(open_heap)
+        g = -neg_g
+        # Both masks packed into a single int for the closed set
+        state_key = assigned << (n + 1) | value
         if state_key in closed:
             continue
         closed.add(state_key)
+        stats['expanded'] += 1
+        if len(open_heap) > stats['peak_frontier']:
+            stats['peak_frontier'] = len(open_heap)
+        budget.step()
 
-        if None not in assgn[1:]:
-            valid = True
-            for clause in clauses:
-                if not any(
-                    (lit > 0 and assgn[abs(lit)] is True) or 
-                    (lit < 0 and assgn[abs(lit)] is False)
-                    for lit in clause
-                ):
-                    valid = False
-                    break
-            if valid:
-                solution = interpret_model(assgn, bridge_vars)
-                if check_connect(solution, islands):
-                    elapsed = time.perf_counter() - start_time
-                    current, peak = tracemalloc.get_traced_memory()
-                    tracemalloc.stop()
-                    return solution, islands, bridges, elapsed, peak / 1024
+        if assigned == full:
+            if unsat == 0:
+                solution = interpret_model(decode(value), bridge_vars, fixed)
+                with profile.phase('connectivity'):
+                    connected = checker.connected(solution)
+                if connected:
+                    return solution
             continue
 
-        try:
-            i = assgn.index(None, 1)
-        except ValueError:
-            i = None
-        if i is None:
-            continue
+        bit = (assigned + 1) & ~assigned
+        v = bit.bit_length() - 1
+        false_bits = assigned & ~value
+        new_assigned = assigned | bit
+        unassigned = full & ~new_assigned
 
         for val in [False, True]:
-            new_assgn = assgn.copy()
-            new_assgn[i] = val
+            new_value = value | bit if val else value
 
-            # Early conflict check
+            # Only the clauses holding v change: they get satisfied, or falsified when v was their last literal
+            new_unsat = unsat
             conflict = False
-            for clause in clauses:
-                sat = False
-                unassigned = False
-                for lit in clause:
-                    if new_assgn[abs(lit)] is None:
-                        unassigned = True
-                        continue
-                    elif (lit > 0 and new_assgn[abs(lit)] is True) or (lit < 0 and new_assgn[abs(lit)] is False):
-                        sat = True
-                        break
-                if not sat and not unassigned:
+            for positive, pos, neg, both in occurrences[v]:
+                if (pos & value) or (neg & false_bits):
+                    continue
+                if positive == val:
+                    new_unsat -= 1
+                elif not (both & unassigned):
                     conflict = True
                     break
             if conflict:
                 continue
 
-            new_g = g + 1
-            new_h = heuristic(new_assgn)
-            heapq.heappush(open_heap, (new_g + new_h, new_g, new_assgn))
+            # Only the two islands of v change: they must neither overshoot nor miss what is left
+            new_deficit = deficit
+            if v in var_islands:
+                if val:
+                    new_deficit -= 2
+                feasible = True
+                for id in var_islands[v]:
+                    need = require[id] - (new_value & incident[id]).bit_count()
+                    if need < 0 or need > (unassigned & incident[id]).bit_count():
+                        feasible = False
+                        break
+                if not feasible:
+                    continue
 
-    elapsed = time.perf_counter() - start_time
-    current, peak = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
+            new_g = g + 1
+            new_h = (new_deficit + 1) // 2
+            heapq.heappush(open_heap, (new_g + new_h, -new_g, new_unsat, new_assigned, new_value, new_deficit))
 
-    return None, None, None, elapsed, peak / 1024 
+    return None
@@ -1,69 +1,168 @@
-from pysat.formula import CNF, IDPool
-from helper import (
-    get_island_info, generate_bridge,
-    add_main_contraints, add_island_contraints, add_non_crossing_constraints,
-    check_connect, get_n_vars, interpret_model
-)
-import time
-import tracemalloc
-
-def solve_with_back_track(matrix):
-    tracemalloc.start()
-    start_time = time.perf_counter()
-
-    islands = get_island_info(matrix)
-    bridges, coord_to_id = generate_bridge(islands, matrix)
-
-    cnf = CNF()
-    vpool = IDPool()
-
-    bridge_vars = add_main_contraints(cnf, vpool, bridges)
-    add_island_contraints(cnf, vpool, islands, bridge_vars)
-    add_non_crossing_constraints(cnf, vpool, bridges)
-
-    clauses = cnf.clauses
+from itertools import chain
+from helper import ConnectivityChecker, get_n_vars, interpret_model
+from encoding_cache import get_encoding
+from instrument import Profile, Budget, run_search
+
+def solve_with_back_track(matrix, profile=None, stats=None, budget=None):
+    """
+    Solve Hashiwokakero with a DPLL search: two-watched-literal unit propagation,
+    a trail that is undone on backtrack, and branching on the bridge variables x1/x2 only.
+      stats: optional dictionary, filled with 'status', 'nodes' (decisions and flips) and 'max_depth'
+      budget: optional instrument.Budget, a new Budget() with the default limits when None
+    """
+    if profile is None:
+        profile = Profile()
+    if stats is None:
+        stats = {}
+    if budget is None:
+        budget = Budget()
+    stats['max_depth'] = 0
+    profile.start()
+    budget.start()
+
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix, profile)
+
+    with profile.phase('search'):
+        solution = run_search(lambda: search(cnf, islands, bridge_vars, fixed, stats, profile, budget), budget, stats)
+
+    elapsed, peak = profile.stop()
+    if solution:
+        return solution, islands, bridges, elapsed, peak
+    else:
+        return None, None, None, elapsed, peak
+
+def search(cnf, islands, bridge_vars, fixed, stats, profile, budget):
+    """
+    DPLL search over the CNF.
+      Output: solution: {(island_id_1, island_id_2) -> count}, or None if there is no connected model
+    """
     n = get_n_vars(cnf)
+    assignment = [None] * (n + 1)
+    trail = []
+    # watches[lit]: clauses currently watching lit, they are visited when lit becomes false
+    watches = {lit: [] for v in range(1, n + 1) for lit in (v, -v)}
+    units = []
+    for clause in cnf.clauses:
+        if not clause:
+            return None
+        if len(clause) == 1:
+            units.append(clause[0])
+            continue
+        clause = list(clause)
+        watches[clause[0]].append(clause)
+        watches[clause[1]].append(clause)
 
-    def is_valid(assignment):
-        for clause in clauses:
-            satisfied = False
-            for lit in clause:
-                val = assignment[abs(lit)]
-                if val is None:
-                    satisfied = True
-                    break
-                elif (lit > 0 and val is True) or (lit < 0 and val is False):
-                    satisfied = True
-                    break
-            if not satisfied:
-                return False
+    def value(lit):
+        val = assignment[abs(lit)]
+        if val is None:
+            return None
+        return val if lit > 0 else not val
+
+    def assign(lit):
+        assignment[abs(lit)] = lit > 0
+        trail.append(lit)
+
+    def propagate(head):
+        """
+        Propagate every literal on the trail from position head.
+        Output: False if a clause became falsified, True otherwise
+        """
+        while head < len(trail):
+            false_lit = -trail[head]
+            head += 1
+            watching = watches[false_lit]
+            i = 0
+            while i < len(watching):
+                clause = watching[i]
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if value(clause[0]) is True:
+                    i += 1
+                    continue
+                # Look for a new literal to watch instead of clause[1]
+                moved = False
+                for k in range(2, len(clause)):
+                    if value(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        watches[clause[1]].append(clause)
+                        watching[i] = watching[-1]
+                        watching.pop()
+                        moved = True
+                        break
+                if moved:
+                    continue
+                other = value(clause[0])
+                if other is False:
+                    return False
+                if other is None:
+                    assign(clause[0])
+                i += 1
         return True
 
-    def backtrack(assignment, i=1):
-        if i > n:
-            if is_valid(assignment):
-                solution = interpret_model(assignment, bridge_vars)
-                if check_connect(solution, islands):
-                    return solution
+    def can_connect():
+        """
+        Check the islands can still be connected using the fixed bridges and the bridges whose x1 is not False.
+        """
+        return checker.connected(chain(fixed, (key for key, x1 in bridge_x1 if assignment[x1] is not False)))
+
+    checker = ConnectivityChecker(islands)
+    bridge_x1 = [(key, x1) for key, (x1, x2) in bridge_vars.items()]
+
+    def undo(size):
+        while len(trail) > size:
+            assignment[abs(trail.pop())] = None
+
+    # Branch on bridge variables first, the card auxiliaries are normally fixed by propagation
+    order = [x for x1, x2 in bridge_vars.values() for x in (x1, x2)]
+    in_order = set(order)
+    order += [v for v in range(1, n + 1) if v not in in_order]
+
+    for lit in units:
+        if value(lit) is False:
             return None
+        if value(lit) is None:
+            assign(lit)
+    ok = propagate(0)
 
-        for val in [False, True]:
-            assignment[i] = val
-            if is_valid(assignment):
-                result = backtrack(assignment, i + 1)
-                if result:
-                    return result
-            assignment[i] = None
-        return None
+    # Each level: (trail size before the decision, index in order, decision literal, both values tried)
+    levels = []
+    while True:
+        if ok:
+            with profile.phase('connectivity'):
+                ok = can_connect()
+        if ok:
+            pos = levels[-1][1] if levels else 0
+            while pos < len(order) and assignment[order[pos]] is not None:
+                pos += 1
+            if pos == len(order):
+                candidate = interpret_model(assignment, bridge_vars, fixed)
+                with profile.phase('connectivity'):
+                    connected = checker.connected(candidate)
+                if connected:
+                    return candidate
+                ok = False
+                continue
+            # Placing the bridge first reaches connected solutions much sooner than leaving it out
+            lit = order[pos]
+            budget.step()
+            levels.append((len(trail), pos, lit, False))
+            if len(levels) > stats['max_depth']:
+                stats['max_depth'] = len(levels)
+            head = len(trail)
+            assign(lit)
+            ok = propagate(head)
+            continue
 
-    assignment = [None] * (n + 1)
-    solution = backtrack(assignment)
-    
-    elapsed = time.perf_counter() - start_time
-    current, peak = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
+        # Conflict: flip the deepest decision that still has an untried value
+        while levels and levels[-1][3]:
+            levels.pop()
+        if not levels:
+            break
+        size, pos, lit, _ = levels.pop()
+        budget.step()
+        undo(size)
+        levels.append((size, pos, -lit, True))
+        assign(-lit)
+        ok = propagate(size)
 
-    if solution:
-        return solution, islands, bridges, elapsed, peak / 1024
-    else:
-        return None, None, None, elapsed, peak / 1024
\ No newline at end of file
+    return None
@@ -0,0 +1,219 @@
+import glob
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+import helper
+from helper import read_file, print_result, get_island_info, generate_bridge
+import instrument
+from instrument import solve_status
+import preprocess
+
+# Smaller puzzles are checked without NumPy, whose import costs more than the check itself
+NUMPY_MIN_CELLS = 100_000
+
+def find_puzzles(pattern):
+    """
+    Get the puzzle files for a directory or a glob pattern, sorted by name.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.txt')
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+def output_name(file_name):
+    """
+    Name of the output file for a puzzle: input-01.txt -> output1.txt, anything else -> output-<name>.
+    """
+    match = re.fullmatch(r'input-(\d+)\.txt', file_name)
+    if match:
+        return f'output{int(match.group(1))}.txt'
+    return f'output-{file_name}'
+
+def impossible_islands(matrix):
+    """
+    Same as grid.over_capacity: the islands needing more than 2 bridges per neighbour, as (row, col, required, capacity).
+    """
+    if len(matrix) * len(matrix[0]) >= NUMPY_MIN_CELLS:
+        from grid import over_capacity
+        return over_capacity(matrix)
+    islands = get_island_info(matrix)
+    bridges, coord_to_id = generate_bridge(islands, matrix)
+    capacity = dict.fromkeys(islands, 0)
+    for id1, id2, extra in bridges:
+        capacity[id1] += 2
+        capacity[id2] += 2
+    return [(r, c, required, capacity[id]) for id, (r, c, required) in islands.items() if required > capacity[id]]
+
+def write_impossible_islands(matrix, output_path):
+    """
+    Write a line for every island that needs more bridges than its neighbours allow (2 per neighbour).
+    """
+    with open(output_path, 'w') as fout:
+        for i, j, required, possible in impossible_islands(matrix):
+            fout.write(f"Island at ({i},{j}) requires {required} bridges but only {possible} possible.\n")
+
+def solve_file(func, input_path, output_path):
+    """
+    Solve one puzzle file and write the result the same way main() does.
+      Output: (status, time, memory, iterations, cuts), status is 'solved', 'no solution', or 'timeout' / 'memout'
+              when the solver budget ran out; iterations and cuts of the connectivity loop, None for the
+              solvers without one
+    """
+    matrix = read_file(input_path)
+    write_impossible_islands(matrix, output_path)
+    stats = {}
+    solution, islands, bridges, t, mem = func(matrix, stats=stats)
+    status = solve_status(stats)
+    if solution is None:
+        reason = '' if status == 'no solution' else f' ({status})'
+        with open(output_path, 'a') as fout:
+            fout.write(f'No solution found for {os.path.basename(input_path)}{reason}\n')
+    else:
+        print_result(matrix, islands, solution, output_path)
+    return status, t, mem, stats.get('iterations'), stats.get('cuts')
+
+def current_settings(pool_workers=None):
+    """
+    The settings of the command line, which live in module globals, for apply_settings in another process.
+    A child started with spawn or forkserver (the default outside Linux, and on Linux from Python 3.14)
+    imports the modules again and would only see their defaults.
+      Input: pool_workers: instrument.POOL_WORKERS for the child, the current one when None
+      Output: tuple (time limit, node limit, memory limit, trace memory, pool workers, card encoding, preprocess,
+              cache dir)
+    """
+    # Not loaded yet: the cache dir was not set, and a child gets the same default from HASHI_CACHE_DIR
+    encoding_cache = sys.modules.get('encoding_cache')
+    cache_dir = encoding_cache.get_cache_dir() if encoding_cache is not None else None
+    if pool_workers is None:
+        pool_workers = instrument.POOL_WORKERS
+    return (instrument.TIME_LIMIT, instrument.NODE_LIMIT, instrument.MEMORY_LIMIT, instrument.TRACE_MEMORY,
+            pool_workers, helper.CARD_ENCODING, preprocess.PREPROCESS, cache_dir)
+
+def apply_settings(settings):
+    """
+    Set the module globals of a child process from current_settings() of its parent.
+    """
+    (instrument.TIME_LIMIT, instrument.NODE_LIMIT, instrument.MEMORY_LIMIT, instrument.TRACE_MEMORY,
+     instrument.POOL_WORKERS, helper.CARD_ENCODING, preprocess.PREPROCESS, cache_dir) = settings
+    if cache_dir is not None:
+        from encoding_cache import set_cache_dir
+        set_cache_dir(cache_dir)
+
+def _run_in_child(conn, settings, target, args):
+    apply_settings(settings)
+    if hasattr(os, 'setpgid'):
+        # Its own process group, so kill() also reaches the pool workers of the solver
+        os.setpgid(0, 0)
+    try:
+        conn.send(target(*args))
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+class ChildProcess:
+    """
+    Call target(*args) in a new process, for a solve that can be killed or raced against others.
+    conn can be given to multiprocessing.connection.wait; it is ready once the child has answered or died.
+    The child leads its own process group, so the processes it starts (the pools of the brute force and
+    cube solvers) die with it, and Ctrl-C in the terminal only reaches the parent, which must kill() it.
+    The child gets the current_settings() of the parent, whatever the start method.
+    pool_workers caps the processes of the solver in the child, when several children run at once.
+    """
+    def __init__(self, target, *args, pool_workers=None):
+        self.conn, child_conn = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=_run_in_child,
+                                               args=(child_conn, current_settings(pool_workers), target, args))
+        self.start = time.perf_counter()
+        self.process.start()
+        child_conn.close()
+
+    def result(self):
+        """
+        Wait for the child and get what target returned. What it raised is returned, not raised:
+        a RuntimeError when the process died without an answer.
+        """
+        try:
+            answer = self.conn.recv()
+        except EOFError:
+            answer = RuntimeError('process exited without an answer')
+        self.conn.close()
+        self.process.join()
+        return answer
+
+    def kill(self):
+        """
+        Stop the child and every process it started.
+        """
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            # No process groups on this system, or the child has not made its group yet
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+def run_batch(paths, func, workers, timeout, output_dir):
+    """
+    Solve puzzle files in parallel, one process per puzzle and at most `workers` at a time.
+    A puzzle still running after `timeout` seconds is killed and reported as 'timeout'.
+      Output: List of (file_name, status, time, memory, iterations, cuts) in the order of paths
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    os.makedirs(output_dir, exist_ok=True)
+    pending = list(enumerate(paths))
+    pending.reverse()
+    running = {}
+    results = [None] * len(paths)
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                idx, path = pending.pop()
+                output_path = os.path.join(output_dir, output_name(os.path.basename(path)))
+                # Several puzzles at once: a cube or brute force solve keeps to its own process
+                child = ChildProcess(solve_file, func, path, output_path, pool_workers=1 if workers > 1 else None)
+                running[child.conn] = (idx, path, output_path, child)
+
+            now = time.perf_counter()
+            deadline = None
+            if timeout is not None:
+                deadline = max(0, min(child.start + timeout for _, _, _, child in running.values()) - now)
+            for conn in wait(list(running), timeout=deadline):
+                idx, path, output_path, child = running.pop(conn)
+                answer = child.result()
+                if isinstance(answer, Exception):
+                    answer = (f'error: {answer}', None, None, None, None)
+                results[idx] = (os.path.basename(path), *answer)
+
+            if timeout is None:
+                continue
+            now = time.perf_counter()
+            for conn, (idx, path, output_path, child) in list(running.items()):
+                if now - child.start >= timeout:
+                    child.kill()
+                    del running[conn]
+                    with open(output_path, 'a') as fout:
+                        fout.write(f'No solution found for {os.path.basename(path)} (timeout after {timeout}s)\n')
+                    results[idx] = (os.path.basename(path), 'timeout', now - child.start, None, None, None)
+    finally:
+        # Only left early by an exception (Ctrl-C): the children would keep running without their parent
+        for idx, path, output_path, child in running.values():
+            child.kill()
+    return results
+
+def format_summary(name, results):
+    """
+    Format the batch results as a text table.
+    """
+    lines = [f'{"File":<20} {"Solver":<14} {"Status":<14} {"Time (s)":>10} {"Memory (KB)":>12} {"Iterations":>10} {"Cuts":>6}']
+    for file_name, status, t, mem, iterations, cuts in results:
+        t_text = f'{t:.4f}' if t is not None else '-'
+        mem_text = f'{mem:.2f}' if mem is not None else '-'
+        iterations_text = iterations if iterations is not None else '-'
+        cuts_text = cuts if cuts is not None else '-'
+        lines.append(f'{file_name:<20} {name:<14} {status:<14} {t_text:>10} {mem_text:>12} {iterations_text:>10} {cuts_text:>6}')
+    return '\n'.join(lines) + '\n'
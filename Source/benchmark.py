@@ -0,0 +1,171 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import statistics
+import time
+from helper import read_file, get_island_info, check_solution
+from generator import generate_puzzle
+from instrument import Profile, percentile, solve_status
+import helper
+import preprocess
+from main import INPUT_DIR
+from registry import methods, find_method
+from batch import ChildProcess
+
+PHASE_FIELDS = ['bridges_s', 'preprocess_s', 'encoding_s', 'search_s', 'connectivity_s']
+FIELDS = ['solver', 'puzzle', 'rows', 'cols', 'islands', 'density', 'seed', 'card_encoding', 'preprocess',
+          'decided', 'vars', 'clauses', 'iterations', 'cuts', 'status', 'runs', 'median_s', 'p95_s'] + PHASE_FIELDS + ['peak_kb', 'traced_kb']
+
+def _solve(func, matrix, trace_memory):
+    profile = Profile(trace_memory=trace_memory)
+    stats = {}
+    answer = func(matrix, profile=profile, stats=stats)
+    return (answer, solve_status(stats)), (profile.phases, profile.counters)
+
+def solve_with_timeout(func, matrix, timeout, trace_memory=False):
+    """
+    Run one solve in a child process, killing it after timeout seconds.
+    Memory is the peak RSS of the solve above the RSS of the child before it, or the tracemalloc peak with trace_memory.
+      Output: (status, time, memory, (phases, counters)), status is 'solved', 'no solution', 'invalid', 'timeout',
+              'memout' or 'error: ...'
+    """
+    child = ChildProcess(_solve, func, matrix, trace_memory)
+    try:
+        ready = child.conn.poll(timeout)
+    except BaseException:
+        child.kill()
+        raise
+    if not ready:
+        child.kill()
+        return 'timeout', time.perf_counter() - child.start, None, (None, None)
+    answer = child.result()
+    if isinstance(answer, Exception):
+        return f'error: {answer}', None, None, (None, None)
+    answer, phases = answer
+    (solution, islands, bridges, t, mem), status = answer
+    if solution is None:
+        return status, t, mem, phases
+    if not check_solution(solution, islands):
+        return 'invalid', t, mem, phases
+    return 'solved', t, mem, phases
+
+def benchmark_puzzle(func, matrix, repeats, timeout, trace_memory=False):
+    """
+    Solve one puzzle `repeats` times and summarize the runs.
+    The timed runs never use tracemalloc; with trace_memory one more run measures the traced peak.
+      Output: dictionary with status, runs, and when measured decided, vars, clauses, median_s, p95_s, the median of
+              every phase, peak_kb, traced_kb
+    """
+    times = []
+    peaks = []
+    phase_times = {field: [] for field in PHASE_FIELDS}
+    status = 'solved'
+    counters = {}
+    for _ in range(repeats):
+        status, t, mem, (phases, counters) = solve_with_timeout(func, matrix, timeout)
+        if status not in ('solved', 'no solution'):
+            break
+        times.append(t)
+        peaks.append(mem)
+        for field in PHASE_FIELDS:
+            phase_times[field].append(phases.get(field[:-2], 0.0))
+    row = {'status': status, 'runs': len(times)}
+    row.update(counters or {})
+    if not times:
+        return row
+    row.update({
+        'median_s': statistics.median(times),
+        'p95_s': percentile(times, 95),
+        'peak_kb': max(peaks),
+    })
+    for field in PHASE_FIELDS:
+        row[field] = statistics.median(phase_times[field])
+    if trace_memory:
+        traced_status, t, mem, phases = solve_with_timeout(func, matrix, timeout, trace_memory=True)
+        row['traced_kb'] = mem
+    return row
+
+def get_cases(input_dir, sizes, densities, seeds):
+    """
+    Bundled puzzles first, then the generated ones, smallest first.
+      Output: List of (puzzle name, matrix, density, seed)
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(input_dir, '*.txt'))):
+        cases.append((os.path.basename(path), read_file(path), None, None))
+    for size in sizes:
+        for density in densities:
+            for seed in seeds:
+                matrix, solution = generate_puzzle(size, size, density, seed)
+                cases.append((f'gen-{size}x{size}-d{density}-s{seed}', matrix, density, seed))
+    return cases
+
+def run_benchmark(solvers, cases, repeats, timeout, trace_memory=False):
+    """
+    Benchmark every solver on every case.
+    Once a solver times out on a generated size for a density, the bigger sizes of that density are skipped.
+      Output: List of result rows, see FIELDS
+    """
+    rows = []
+    for name, func in solvers:
+        failed_at = {}
+        for puzzle, matrix, density, seed in cases:
+            size = len(matrix) * len(matrix[0])
+            row = {
+                'solver': name, 'puzzle': puzzle, 'rows': len(matrix), 'cols': len(matrix[0]),
+                'islands': len(get_island_info(matrix)), 'density': density, 'seed': seed,
+                'card_encoding': helper.CARD_ENCODING, 'preprocess': preprocess.PREPROCESS,
+            }
+            if density is not None and failed_at.get(density, size + 1) < size:
+                row.update({'status': 'skipped', 'runs': 0})
+            else:
+                row.update(benchmark_puzzle(func, matrix, repeats, timeout, trace_memory))
+                if row['status'] == 'timeout' and density is not None:
+                    failed_at[density] = min(failed_at.get(density, size), size)
+            row.update({field: None for field in FIELDS if field not in row})
+            rows.append(row)
+            median = f"{row['median_s']:.4f}s" if row['median_s'] is not None else '-'
+            print(f"{name:<14} {puzzle:<28} {row['status']:<12} {median}")
+    return rows
+
+def write_results(rows, prefix):
+    with open(prefix + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(prefix + '.json', 'w') as f:
+        json.dump(rows, f, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Hashiwokakero solvers on Input/ and generated puzzles.")
+    parser.add_argument('--solvers', nargs='*', default=None, help="solver names or menu numbers (default: all)")
+    parser.add_argument('--sizes', nargs='*', type=int, default=[7, 10, 15, 20, 25, 30, 40])
+    parser.add_argument('--densities', nargs='*', type=float, default=[0.1, 0.2])
+    parser.add_argument('--seeds', nargs='*', type=int, default=[0, 1, 2])
+    parser.add_argument('--repeats', type=int, default=3, help="runs per puzzle, used for the median and p95")
+    parser.add_argument('--timeout', type=float, default=30, help="seconds allowed per run")
+    parser.add_argument('--input', default=INPUT_DIR, help="directory of bundled puzzles")
+    parser.add_argument('--no-preprocess', action='store_true', help="do not fix the forced bridges before solving")
+    parser.add_argument('--card-encoding', default=helper.CARD_ENCODING, choices=sorted(helper.CARD_ENCODINGS), help="cardinality encoding of the island constraints")
+    parser.add_argument('--trace-memory', action='store_true', help="add one tracemalloc run per puzzle for traced_kb")
+    parser.add_argument('--output', default='benchmark', help="prefix of the .csv and .json result files")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    helper.CARD_ENCODING = args.card_encoding
+    preprocess.PREPROCESS = not args.no_preprocess
+    if args.solvers:
+        solvers = []
+        for name in args.solvers:
+            method = find_method(name)
+            if method is None:
+                raise SystemExit(f"Unknown solver: {name}")
+            solvers.append(method)
+    else:
+        solvers = list(methods.values())
+    cases = get_cases(args.input, args.sizes, args.densities, args.seeds)
+    rows = run_benchmark(solvers, cases, args.repeats, args.timeout, args.trace_memory)
+    write_results(rows, args.output)
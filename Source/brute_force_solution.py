@@ -1,45 +1,227 @@
-from pysat.formula import CNF, IDPool
-import itertools
-from helper import get_island_info, generate_bridge, add_main_contraints, add_island_contraints, add_non_crossing_constraints, check_connect, get_n_vars, interpret_model
+import multiprocessing
+import os
 import time
-import tracemalloc
+from collections import deque
+from helper import ConnectivityChecker
+from encoding_cache import get_encoding
+from preprocess import residual_islands
+import instrument
+from instrument import Profile, Budget, run_search
 
-def solve_with_brute_force(matrix):
-    tracemalloc.start()
-    start_time = time.perf_counter()
+# Processes sharing the enumeration, and the free variables below which it stays in this process
+WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_BITS = 18
+# Each chunk enumerates the low CHUNK_BITS free variables under one prefix of the others
+CHUNK_BITS = 14
+# Seconds of one step of the enumeration, between two looks at the budget
+STEP_SECONDS = 0.05
 
-    islands = get_island_info(matrix)
-    bridges, coord_to_id = generate_bridge(islands, matrix)
+def solve_with_brute_force(matrix, profile=None, stats=None, budget=None, workers=None):
+    """
+    Try every assignment of the bridge variables until one is a connected model, skipping the runs of
+    assignments that a clause or an island already rules out.
+    The auxiliary variables of the cardinality encodings are not enumerated: the island sums are checked
+    on the bridge variables directly, which is what any assignment of the auxiliary variables would allow.
+      stats: optional dictionary, filled with 'status', 'nodes' (assignments tried, 1 per prefix ruled out),
+             'bits' (variables enumerated) and 'workers'
+      budget: optional instrument.Budget, a new Budget() with the default limits when None
+      workers: processes of the enumeration, instrument.POOL_WORKERS or else WORKERS when None
+    """
+    if profile is None:
+        profile = Profile()
+    if stats is None:
+        stats = {}
+    if budget is None:
+        budget = Budget()
+    if workers is None:
+        workers = instrument.POOL_WORKERS or WORKERS
+    profile.start()
+    budget.start()
 
-    cnf = CNF()
-    vpool = IDPool()
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix, profile)
 
-    bridge_vars = add_main_contraints(cnf, vpool, bridges)
-    add_island_contraints(cnf, vpool, islands, bridge_vars)
-    add_non_crossing_constraints(cnf, vpool, bridges)
+    with profile.phase('search'):
+        problem = bitmask_problem(cnf, islands, bridge_vars, fixed)
+        n_free = problem[0]
+        # A pool worker is daemonic and cannot start processes of its own
+        if n_free < PARALLEL_MIN_BITS or multiprocessing.current_process().daemon:
+            workers = 1
+        stats['bits'] = n_free
+        stats['workers'] = workers
+        model = run_search(lambda: search(problem, workers, budget), budget, stats)
 
-    clauses = cnf.clauses
-    n = get_n_vars(cnf)
+    elapsed, peak = profile.stop()
+    if model is not None:
+        return decode_model(model, problem), islands, bridges, elapsed, peak
+    return None, None, None, elapsed, peak
 
-    for c in itertools.product([False, True], repeat=n):
-        assignment = [None] + list(c)
-        satisfied = True
+def bitmask_problem(cnf, islands, bridge_vars, fixed):
+    """
+    Turn the encoding into integer masks over the bridge variables, so an assignment is one int.
+    Unit clauses fix their bit once and for all; the free bits come first, so assignment = base | index.
+      Output: (n_free, base, clauses, degrees, bits, fixed, checker)
+        clauses: List of (pos, neg) masks, satisfied by a when a & pos or ~a & neg
+        degrees: List of (mask, required), satisfied by a when (a & mask).bit_count() == required
+        bits: {(island_id_1, island_id_2) -> (x1 bit, x2 bit)}
+    """
+    units = {}
+    for clause in cnf.clauses:
+        if len(clause) == 1 and abs(clause[0]) not in units:
+            units[abs(clause[0])] = clause[0] > 0
 
-        for clause in clauses:
-            if not any((lit > 0 and assignment[abs(lit)]) or
-                       (lit < 0 and not assignment[abs(lit)]) for lit in clause):
-                satisfied = False
+    variables = [x for pair in bridge_vars.values() for x in pair]
+    free = [x for x in variables if x not in units]
+    position = {x: b for b, x in enumerate(free + [x for x in variables if x in units])}
+    base = 0
+    for x in variables:
+        if units.get(x):
+            base |= 1 << position[x]
+
+    clauses = []
+    for clause in cnf.clauses:
+        # Clauses with auxiliary variables belong to the cardinality encodings, replaced by degrees
+        if all(abs(lit) in position for lit in clause):
+            pos = neg = 0
+            for lit in clause:
+                if lit > 0:
+                    pos |= 1 << position[lit]
+                else:
+                    neg |= 1 << position[-lit]
+            clauses.append((pos, neg))
+    clauses.sort(key=lambda c: (c[0] | c[1]).bit_count())
+
+    bits = {key: (position[x1], position[x2]) for key, (x1, x2) in bridge_vars.items()}
+    masks = {id: 0 for id in islands.keys()}
+    for (i, j), (b1, b2) in bits.items():
+        masks[i] |= (1 << b1) | (1 << b2)
+        masks[j] |= (1 << b1) | (1 << b2)
+    degrees = [(masks[id], req) for id, (r, c, req) in residual_islands(islands, fixed).items()]
+    return len(free), base, clauses, degrees, bits, fixed, ConnectivityChecker(islands)
+
+def decode_model(model, problem):
+    n_free, base, clauses, degrees, bits, fixed, checker = problem
+    solution = dict(fixed)
+    for key, (b1, b2) in bits.items():
+        if model >> b1 & 1:
+            solution[key] = 1 + (model >> b2 & 1)
+    return solution
+
+def _next_prefix(prefix, mask, n_low, end):
+    """
+    First prefix after prefix that changes a free bit of mask above n_low, end when there is none.
+    """
+    high_bits = (mask >> n_low) & (end - 1)
+    if not high_bits:
+        return end
+    k = (high_bits & -high_bits).bit_length() - 1
+    return ((prefix >> k) + 1) << k
+
+def search_chunk(problem, prefix, n_low):
+    """
+    Enumerate the assignments whose free bits above n_low are prefix.
+    Clauses and islands decided by the prefix are settled first: a satisfied one is dropped and the rest are
+    reduced to the low bits. A falsified one stays falsified for every prefix that keeps its bits, so the
+    enumeration jumps to the first prefix that changes one of them.
+      Output: (model or None, nodes, next prefix), nodes is the assignments tried, 1 for a prefix ruled out
+    """
+    n_free, base, clauses, degrees, bits, fixed, checker = problem
+    low = (1 << n_low) - 1
+    end = 1 << (n_free - n_low)
+    high = base | prefix << n_low
+
+    ruled_out = False
+    next_prefix = prefix + 1
+    low_clauses = []
+    for pos, neg in clauses:
+        if high & pos or ~high & neg & ~low:
+            continue
+        if not (pos | neg) & low:
+            ruled_out = True
+            next_prefix = max(next_prefix, _next_prefix(prefix, pos | neg, n_low, end))
+        else:
+            low_clauses.append((pos & low, neg & low))
+    low_degrees = []
+    for mask, req in degrees:
+        req -= (high & mask).bit_count()
+        if req < 0 or req > (mask & low).bit_count():
+            ruled_out = True
+            next_prefix = max(next_prefix, _next_prefix(prefix, mask, n_low, end))
+        elif mask & low:
+            low_degrees.append((mask & low, req))
+    if ruled_out:
+        return None, 1, next_prefix
+    # The most constrained islands fail first
+    low_degrees.sort(key=lambda d: d[0].bit_count())
+
+    for a in range(low + 1):
+        for mask, req in low_degrees:
+            if (a & mask).bit_count() != req:
                 break
+        else:
+            for pos, neg in low_clauses:
+                if not (a & pos or ~a & neg):
+                    break
+            else:
+                model = high | a
+                pairs = [key for key, (b1, b2) in bits.items() if model >> b1 & 1]
+                if checker.connected(list(fixed) + pairs):
+                    return model, a + 1, next_prefix
+    return None, low + 1, next_prefix
+
+def search_range(problem, start, stop, n_low):
+    """
+    Enumerate the prefixes from start up to stop, until a model is found or STEP_SECONDS have passed.
+      Output: (model or None, nodes, prefix to resume from)
+    """
+    deadline = time.perf_counter() + STEP_SECONDS
+    nodes = 0
+    prefix = start
+    while prefix < stop and time.perf_counter() < deadline:
+        model, tried, prefix = search_chunk(problem, prefix, n_low)
+        nodes += tried
+        if model is not None:
+            return model, nodes, prefix
+    return None, nodes, min(prefix, stop)
+
+_problem = None
+
+def _init_worker(problem):
+    global _problem
+    _problem = problem
+
+def _search_range_in_worker(start, stop, n_low):
+    return search_range(_problem, start, stop, n_low)
+
+def search(problem, workers, budget):
+    """
+    Enumerate the prefixes in steps of STEP_SECONDS and return the first connected model, charging the budget
+    after each step. With workers > 1 the prefixes are cut into 4 stripes per worker, walked on a pool.
+    """
+    n_free = problem[0]
+    n_low = min(n_free, CHUNK_BITS)
+    end = 1 << (n_free - n_low)
+
+    if workers == 1:
+        prefix = 0
+        while prefix < end:
+            model, nodes, prefix = search_range(problem, prefix, end, n_low)
+            budget.step(nodes)
+            if model is not None:
+                return model
+        return None
 
-        if satisfied:
-            solution = interpret_model(assignment, bridge_vars)
-            if check_connect(solution, islands):
-                elapsed = time.perf_counter() - start_time
-                current, peak = tracemalloc.get_traced_memory()
-                tracemalloc.stop()
-                return solution, islands, bridges, elapsed, peak / 1024
-
-    elapsed = time.perf_counter() - start_time
-    current, peak = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
-    return None, None, None, elapsed, peak / 1024
+    n_stripes = min(end, 4 * workers)
+    bounds = [end * s // n_stripes for s in range(n_stripes + 1)]
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(problem,)) as pool:
+        pending = deque()
+        for start, stop in zip(bounds, bounds[1:]):
+            pending.append((stop, pool.apply_async(_search_range_in_worker, (start, stop, n_low))))
+        while pending:
+            stop, result = pending.popleft()
+            model, nodes, prefix = result.get()
+            budget.step(nodes)
+            if model is not None:
+                return model
+            if prefix < stop:
+                pending.append((stop, pool.apply_async(_search_range_in_worker, (prefix, stop, n_low))))
+    return None
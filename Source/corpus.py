@@ -0,0 +1,143 @@
+import argparse
+import os
+import numpy as np
+from helper import render_result
+
+# Packed corpus layout, every number little-endian:
+#   MAGIC | grid 1 | grid 2 | ... | index (offset u64, rows u32, cols u32 per grid) | index offset u64 | count u64
+# A grid is rows * cols uint8 cells, row-major. The index sits at the end so a corpus can be written as a stream.
+MAGIC = b'HASHIPK1'
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('rows', '<u4'), ('cols', '<u4')])
+TRAILER_DTYPE = np.dtype([('index_offset', '<u8'), ('count', '<u8')])
+
+# Solution grids use the same format: 0-8 are empty cells and islands, the bridges get their own codes
+SYMBOLS = '012345678-=|$'
+SYMBOL_CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+_SYMBOL_TABLE = np.full(256, 255, dtype=np.uint8)
+for _symbol, _code in SYMBOL_CODES.items():
+    _SYMBOL_TABLE[ord(_symbol)] = _code
+
+def write_corpus(filename, grids):
+    """
+    Pack grids (puzzle matrices or solution grids) into one file.
+      Input: filename, grids: iterable of 2D lists or uint8 arrays, consumed one at a time
+      Output: number of grids written
+    """
+    index = []
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for grid in grids:
+            cells = np.ascontiguousarray(grid, dtype=np.uint8)
+            f.write(cells.tobytes())
+            index.append((offset, cells.shape[0], cells.shape[1]))
+            offset += cells.size
+        f.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+        f.write(np.array([(offset, len(index))], dtype=TRAILER_DTYPE).tobytes())
+    return len(index)
+
+def open_corpus(filename):
+    """
+    Memory-map a corpus without reading it.
+      Output: (data, index): data is the whole file as a uint8 memmap, index a structured array of offset, rows, cols
+    """
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f'{filename} is not a packed puzzle corpus')
+    trailer = data[-TRAILER_DTYPE.itemsize:].view(TRAILER_DTYPE)[0]
+    start = int(trailer['index_offset'])
+    index = data[start:start + int(trailer['count']) * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+    return data, index
+
+def read_corpus(filename):
+    """
+    Stream the grids of a corpus as (rows, cols) uint8 views into the memory map, without copying.
+    """
+    data, index = open_corpus(filename)
+    for offset, rows, cols in index.tolist():
+        yield data[offset:offset + rows * cols].reshape(rows, cols)
+
+def read_matrices(filename):
+    """
+    Stream the puzzles of a corpus as lists of lists of ints, the matrix format every solver takes.
+    """
+    for grid in read_corpus(filename):
+        yield grid.tolist()
+
+def parse_puzzle(text):
+    """
+    Parse a puzzle in the Input/ layout ("0 , 2 , 0" per row) into a uint8 array.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    cells = np.array(text.replace(',', ' ').split(), dtype=np.uint8)
+    return cells.reshape(len(lines), -1)
+
+def parse_solution(text):
+    """
+    Parse a print_result grid ("2 - 2 0" per row) into a uint8 array of symbol codes.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    cells = _SYMBOL_TABLE[np.frombuffer(''.join(text.split()).encode('ascii'), dtype=np.uint8)]
+    if (cells == 255).any():
+        raise ValueError('unknown symbol in solution grid')
+    return cells.reshape(len(lines), -1)
+
+def solution_grid(matrix, islands, solution):
+    """
+    Encode a solution like print_result draws it, as a uint8 array of symbol codes.
+    """
+    return np.array([[SYMBOL_CODES[cell] for cell in row] for row in render_result(matrix, islands, solution)], dtype=np.uint8)
+
+def format_puzzle(grid):
+    return ''.join(' , '.join(str(cell) for cell in row) + '\n' for row in np.asarray(grid).tolist())
+
+def format_solution(grid):
+    return ''.join(' '.join(SYMBOLS[cell] for cell in row) + '\n' for row in np.asarray(grid).tolist())
+
+def pack_files(paths, filename, solutions=False):
+    """
+    Convert text puzzles (or print_result outputs with solutions=True) into one corpus.
+    """
+    parse = parse_solution if solutions else parse_puzzle
+
+    def grids():
+        for path in paths:
+            with open(path) as f:
+                yield parse(f.read())
+    return write_corpus(filename, grids())
+
+def unpack_files(filename, output_dir, solutions=False):
+    """
+    Convert a corpus back to one text file per grid, named like Input/ (input-01.txt) or output/ (output1.txt).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    for count, grid in enumerate(read_corpus(filename), 1):
+        if solutions:
+            name, text = f'output{count}.txt', format_solution(grid)
+        else:
+            name, text = f'input-{count:02d}.txt', format_puzzle(grid)
+        with open(os.path.join(output_dir, name), 'w') as f:
+            f.write(text)
+    return count
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert puzzles or solutions between text files and a packed corpus.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help="text files -> corpus")
+    pack.add_argument('corpus')
+    pack.add_argument('files', nargs='+')
+    pack.add_argument('--solutions', action='store_true', help="the files are print_result outputs")
+    unpack = commands.add_parser('unpack', help="corpus -> text files")
+    unpack.add_argument('corpus')
+    unpack.add_argument('output_dir')
+    unpack.add_argument('--solutions', action='store_true', help="the corpus holds solution grids")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'pack':
+        count = pack_files(sorted(args.files), args.corpus, args.solutions)
+    else:
+        count = unpack_files(args.corpus, args.output_dir, args.solutions)
+    print(f"{count} grids")
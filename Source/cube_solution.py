@@ -0,0 +1,209 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import statistics
+from pysat.solvers import Solver
+from helper import read_file
+from generator import generate_puzzle
+from encoding_cache import get_encoding
+import preprocess
+from preprocess import residual_islands
+from pysat_solution import search, solve_with_pysat
+import instrument
+from instrument import Profile, Budget, BudgetExceeded, run_search
+
+# Processes solving cubes, and the cubes wanted per process: more cubes balance the load better,
+# fewer cost less splitting
+WORKERS = os.cpu_count() or 1
+CUBES_PER_WORKER = 4
+
+def choose_cube_bridges(islands, bridge_vars, fixed, depth):
+    """
+    Pick the undecided bridges to split on: those whose islands still need the most bridges,
+    then those whose islands have the most undecided bridges.
+      Output: List of depth keys of bridge_vars
+    """
+    require = residual_islands(islands, fixed)
+    degree = {id: 0 for id in islands.keys()}
+    for i, j in bridge_vars.keys():
+        degree[i] += 1
+        degree[j] += 1
+    def impact(key):
+        i, j = key
+        return require[i][2] + require[j][2], degree[i] + degree[j]
+    return sorted(bridge_vars.keys(), key=impact, reverse=True)[:depth]
+
+def make_cubes(bridge_vars, keys):
+    """
+    One cube per combination of counts (0, 1 or 2) of the given bridges.
+    x2 implies x1 in the encoding, so -x1 stands for 0 and x2 for 2.
+      Output: List of assumption lists, 3 ** len(keys) of them
+    """
+    choices = []
+    for key in keys:
+        x1, x2 = bridge_vars[key]
+        choices.append(([-x1], [x1, -x2], [x2]))
+    return [[lit for part in combination for lit in part] for combination in itertools.product(*choices)]
+
+def cube_depth(workers, n_bridges):
+    """
+    Bridges to split on for CUBES_PER_WORKER cubes per worker, at most n_bridges.
+    """
+    depth = 0
+    while 3 ** depth < CUBES_PER_WORKER * workers and depth < n_bridges:
+        depth += 1
+    return depth
+
+def new_worker(clauses, islands, bridge_vars, fixed, budget):
+    """
+    A glucose3 solver and what conquer needs besides the cube. The budget must be started.
+    """
+    return Solver(name='glucose3', bootstrap_with=clauses), islands, bridge_vars, fixed, budget
+
+def conquer(worker, cube):
+    """
+    Solve one cube with the connectivity loop of pysat_solution.search.
+    The cuts it adds stay in the solver and help with the next cubes of this worker.
+      Output: (solution or None, status, stats): status 'solved', 'unsat', 'timeout' or 'memout',
+              stats: iterations, cuts and nodes (conflicts) of this cube
+    """
+    solver, islands, bridge_vars, fixed, budget = worker
+    stats = {'iterations': 0, 'cuts': 0}
+    nodes = budget.nodes
+    try:
+        solution = search(solver, islands, bridge_vars, fixed, True, stats, Profile(), budget, assumptions=cube)
+        status = 'unsat' if solution is None else 'solved'
+    except BudgetExceeded as e:
+        solution, status = None, e.status
+    stats['nodes'] = budget.nodes - nodes
+    return solution, status, stats
+
+_worker = None
+
+def _init_worker(clauses, islands, bridge_vars, fixed, limits):
+    global _worker
+    budget = Budget(*limits)
+    budget.start()
+    _worker = new_worker(clauses, islands, bridge_vars, fixed, budget)
+
+def _conquer_in_worker(cube):
+    return conquer(_worker, cube)
+
+def solve_with_cubes(matrix, workers=None, depth=None, stats=None, profile=None, budget=None):
+    """
+    Cube-and-conquer: split the puzzle on the counts of a few high-impact bridges and solve the cubes
+    (as assumptions) on a process pool. Each worker keeps one solver, and its cuts, across its cubes.
+    The first connected solution stops every worker; the puzzle has no solution when every cube is unsat.
+      workers: processes, instrument.POOL_WORKERS or else WORKERS when None; with 1 the cubes are solved in this process
+      depth: bridges to split on (3 ** depth cubes), enough for CUBES_PER_WORKER cubes per worker when None
+      stats: optional dictionary, filled with 'status', 'nodes' (conflicts of all the workers), 'iterations',
+             'cuts', 'workers', 'cubes' and 'cubes_done' (cubes finished before the answer)
+      budget: optional instrument.Budget, a new Budget() with the default limits when None.
+              Each worker gets what is left of it when the pool starts, and the conflicts are charged
+              as the cubes finish.
+    """
+    if profile is None:
+        profile = Profile()
+    if stats is None:
+        stats = {}
+    if budget is None:
+        budget = Budget()
+    if workers is None:
+        workers = instrument.POOL_WORKERS or WORKERS
+    # A pool worker is daemonic and cannot start processes of its own
+    if multiprocessing.current_process().daemon:
+        workers = 1
+    profile.start()
+    budget.start()
+
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix, profile)
+    if depth is None:
+        depth = cube_depth(workers, len(bridge_vars))
+    cubes = make_cubes(bridge_vars, choose_cube_bridges(islands, bridge_vars, fixed, depth))
+    stats.update({'workers': workers, 'cubes': len(cubes), 'cubes_done': 0, 'iterations': 0, 'cuts': 0})
+
+    def first_solution(results, charge):
+        for solution, status, cube_stats in results:
+            stats['cubes_done'] += 1
+            stats['iterations'] += cube_stats['iterations']
+            stats['cuts'] += cube_stats['cuts']
+            if charge:
+                budget.nodes += cube_stats['nodes']
+            if status in ('timeout', 'memout'):
+                raise BudgetExceeded(status)
+            if solution is not None:
+                return solution
+            if charge:
+                # Only the cubes without a solution stop on the budget, like pysat_solution.sat_call
+                budget.step(0)
+                budget.check()
+        return None
+
+    def conquer_all():
+        if workers == 1:
+            worker = new_worker(cnf.clauses, islands, bridge_vars, fixed, budget)
+            try:
+                return first_solution((conquer(worker, cube) for cube in cubes), charge=False)
+            finally:
+                worker[0].delete()
+        limits = (budget.remaining(), budget.node_limit, budget.memory_limit)
+        initargs = (cnf.clauses, islands, bridge_vars, fixed, limits)
+        # Leaving the with block terminates the workers still busy on other cubes
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            return first_solution(pool.imap_unordered(_conquer_in_worker, cubes), charge=True)
+
+    with profile.phase('search'):
+        solution = run_search(conquer_all, budget, stats)
+    profile.count_search(stats)
+
+    elapsed, peak = profile.stop()
+    if solution is not None:
+        return solution, islands, bridges, elapsed, peak
+    return None, None, None, elapsed, peak
+
+def measure_speedup(matrix, cores, repeats):
+    """
+    Solve one puzzle with each number of cores, on the same cubes (the depth of the most cores),
+    and with plain pysat for reference. The encoding is built first and cached, so no run times it.
+      Output: (pysat seconds, List of (cores, cubes, status, median seconds, speedup over the first row))
+    """
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix)
+    pysat_times = [solve_with_pysat(matrix)[3] for _ in range(repeats)]
+    depth = cube_depth(max(cores), len(bridge_vars))
+    rows = []
+    for n in cores:
+        times = []
+        for _ in range(repeats):
+            stats = {}
+            solution, islands, bridges, t, mem = solve_with_cubes(matrix, workers=n, depth=depth, stats=stats)
+            times.append(t)
+        median = statistics.median(times)
+        speedup = rows[0][3] / median if rows else 1.0
+        rows.append((n, stats['cubes'], stats['status'], median, speedup))
+    return statistics.median(pysat_times), rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the cube-and-conquer speedup on one puzzle for several core counts.")
+    parser.add_argument('puzzle', nargs='?', default=None, help="puzzle file (default: a generated puzzle)")
+    parser.add_argument('--size', type=int, default=60, help="rows and columns of the generated puzzle")
+    parser.add_argument('--density', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cores', nargs='*', type=int, default=None, help="core counts to compare (default: 1, 2, 4, ... up to every core)")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per core count, the median is kept")
+    parser.add_argument('--no-preprocess', action='store_true', help="do not fix the forced bridges before solving")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    preprocess.PREPROCESS = not args.no_preprocess
+    if args.puzzle:
+        matrix = read_file(args.puzzle)
+    else:
+        matrix, solution = generate_puzzle(args.size, args.size, args.density, args.seed)
+    cores = args.cores or [n for n in (1, 2, 4, 8, 16, 32, 64) if n < WORKERS] + [WORKERS]
+    pysat_time, rows = measure_speedup(matrix, cores, args.repeats)
+    print(f"pySAT (1 core, no cubes): {pysat_time:.4f}s")
+    print(f"{'cores':>5} {'cubes':>6} {'status':<8} {'median_s':>9} {'speedup':>8}")
+    for n, n_cubes, status, median, speedup in rows:
+        print(f"{n:>5} {n_cubes:>6} {status:<8} {median:>9.4f} {speedup:>7.2f}x")
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pysat.formula import CNF, IDPool
+import helper
+from helper import (
+    get_island_info, generate_bridge,
+    add_main_contraints, add_island_contraints, add_non_crossing_constraints
+)
+import preprocess
+from preprocess import preprocess_bridges, residual_islands, add_domain_constraints
+from instrument import Profile
+
+# In-memory tier: the most recently used encodings, keyed by puzzle hash
+MAX_ENTRIES = 64
+_memory = OrderedDict()
+# On-disk tier: <hash>.cnf (DIMACS) and <hash>.json (islands, bridges, bridge_vars, fixed), off when None
+_cache_dir = os.environ.get('HASHI_CACHE_DIR')
+
+def set_cache_dir(path):
+    """
+    Turn the on-disk tier on (a directory) or off (None).
+    """
+    global _cache_dir
+    _cache_dir = path
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+
+def get_cache_dir():
+    return _cache_dir
+
+def clear_cache():
+    _memory.clear()
+
+def puzzle_hash(matrix):
+    """
+    Hash of a matrix, the same for equal puzzles whatever the container (lists or arrays).
+    """
+    digest = hashlib.sha256(f'{len(matrix)}x{len(matrix[0])}:'.encode())
+    for row in matrix:
+        digest.update(bytes(int(cell) for cell in row))
+    return digest.hexdigest()
+
+def build_encoding(matrix, profile, card_encoding, use_preprocess):
+    """
+    Build the islands, bridges and CNF of a puzzle from scratch.
+    With use_preprocess only the bridges left undecided by preprocess_bridges get variables.
+      Output: (islands, bridges, bridge_vars, cnf, fixed)
+    """
+    with profile.phase('bridges'):
+        islands = get_island_info(matrix)
+        bridges, coord_to_id = generate_bridge(islands, matrix)
+
+    cnf = CNF()
+    vpool = IDPool()
+
+    fixed, residual, domains = {}, bridges, {}
+    if use_preprocess:
+        with profile.phase('preprocess'):
+            reduced = preprocess_bridges(islands, bridges)
+        if reduced is None:
+            cnf.append([])
+            return islands, bridges, {}, cnf, {}
+        fixed, residual, domains = reduced
+
+    bridge_vars = add_main_contraints(cnf, vpool, residual)
+    add_domain_constraints(cnf, bridge_vars, domains)
+    add_island_contraints(cnf, vpool, residual_islands(islands, fixed), bridge_vars, card_encoding)
+    add_non_crossing_constraints(cnf, vpool, residual)
+    return islands, bridges, bridge_vars, cnf, fixed
+
+def get_encoding(matrix, profile=None, card_encoding=None, use_preprocess=None):
+    """
+    Get the encoding of a puzzle, from memory, then from disk, and build it only when both miss.
+    The result is shared between callers and must not be modified.
+    card_encoding: cardinality encoding of the islands, helper.CARD_ENCODING when None.
+    use_preprocess: fix the forced bridges first, preprocess.PREPROCESS when None.
+      Output: (islands, bridges, bridge_vars, cnf, fixed)
+        bridge_vars only holds the undecided bridges, fixed the decided ones {(island_id_1, island_id_2) -> count}:
+        a model of cnf is a solution once fixed is added to it (interpret_model does).
+    """
+    if profile is None:
+        profile = Profile()
+    if card_encoding is None:
+        card_encoding = helper.CARD_ENCODING
+    if use_preprocess is None:
+        use_preprocess = preprocess.PREPROCESS
+    with profile.phase('encoding'):
+        key = f'{puzzle_hash(matrix)}-{card_encoding}'
+        if card_encoding == 'auto':
+            key += f'-{helper.DIRECT_MAX_CLAUSES}-{helper.AUTO_FALLBACK}'
+        if use_preprocess:
+            key += '-pre'
+        encoding = _memory.get(key)
+        if encoding is None:
+            encoding = load_encoding(key) if _cache_dir is not None else None
+            if encoding is None:
+                encoding = build_encoding(matrix, profile, card_encoding, use_preprocess)
+                if _cache_dir is not None:
+                    save_encoding(key, encoding)
+            _memory[key] = encoding
+            if len(_memory) > MAX_ENTRIES:
+                _memory.popitem(last=False)
+        else:
+            _memory.move_to_end(key)
+
+        islands, bridges, bridge_vars, cnf, fixed = encoding
+        profile.count_formula(cnf)
+        profile.count_decided(len(bridges) - len(bridge_vars) if use_preprocess else 0)
+        return encoding
+
+def save_encoding(key, encoding):
+    islands, bridges, bridge_vars, cnf, fixed = encoding
+    base = os.path.join(_cache_dir, key)
+    cnf.to_file(base + '.cnf')
+    metadata = {
+        'islands': [[id, r, c, req] for id, (r, c, req) in islands.items()],
+        'bridges': [[i, j, list(extra)] for (i, j, extra) in bridges],
+        'bridge_vars': [[i, j, x1, x2] for (i, j), (x1, x2) in bridge_vars.items()],
+        'fixed': [[i, j, count] for (i, j), count in fixed.items()],
+        'n_clauses': len(cnf.clauses),
+    }
+    # Written last: a DIMACS file without its metadata is ignored
+    with open(base + '.json', 'w') as f:
+        json.dump(metadata, f)
+
+def load_encoding(key):
+    base = os.path.join(_cache_dir, key)
+    if not (os.path.exists(base + '.json') and os.path.exists(base + '.cnf')):
+        return None
+    with open(base + '.json') as f:
+        metadata = json.load(f)
+    cnf = CNF(from_file=base + '.cnf')
+    if len(cnf.clauses) != metadata['n_clauses']:
+        return None
+    islands = {id: (r, c, req) for id, r, c, req in metadata['islands']}
+    bridges = [(i, j, tuple(extra)) for i, j, extra in metadata['bridges']]
+    bridge_vars = {(i, j): (x1, x2) for i, j, x1, x2 in metadata['bridge_vars']}
+    fixed = {(i, j): count for i, j, count in metadata.get('fixed', [])}
+    return islands, bridges, bridge_vars, cnf, fixed
@@ -0,0 +1,96 @@
+import random
+from helper import get_island_info
+
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+def generate_puzzle(rows, cols, density=0.2, seed=None, extra_bridges=0.3):
+    """
+    Generate a puzzle together with a connected solution.
+    Islands are grown as a spanning tree: a new island is put at the end of a straight, free path
+    from an existing island, so the bridges never cross. Then some extra bridges are added between
+    neighbouring islands to make loops and double bridges.
+      Input: rows, cols, density (fraction of the cells that are islands), seed,
+             extra_bridges (chance to add a bridge on each free neighbour pair)
+      Output: matrix, solution: {(island_id_1, island_id_2) -> count} with the ids of get_island_info
+    """
+    rng = random.Random(seed)
+    target = max(2, int(rows * cols * density))
+    # cell -> 'island' or the pair of island cells of the bridge going through it
+    used = {}
+    degree = {}
+    bridges = {}
+
+    def path(a, b):
+        (r1, c1), (r2, c2) = a, b
+        if r1 == r2:
+            return [(r1, c) for c in range(min(c1, c2) + 1, max(c1, c2))]
+        return [(r, c1) for r in range(min(r1, r2) + 1, max(r1, r2))]
+
+    def add_bridge(a, b, count):
+        key = tuple(sorted((a, b)))
+        bridges[key] = bridges.get(key, 0) + count
+        degree[a] += count
+        degree[b] += count
+        for cell in path(a, b):
+            used[cell] = key
+
+    start = (rng.randrange(rows), rng.randrange(cols))
+    used[start] = 'island'
+    degree[start] = 0
+    attempts = 0
+    while len(degree) < target and attempts < target * 100:
+        attempts += 1
+        r, c = rng.choice(list(degree))
+        dr, dc = rng.choice(DIRECTIONS)
+        length = rng.randint(2, max(2, min(rows, cols) // 3))
+        cells = [(r + dr * k, c + dc * k) for k in range(1, length + 1)]
+        if any(not (0 <= x < rows and 0 <= y < cols) or (x, y) in used for x, y in cells):
+            continue
+        end = cells[-1]
+        # Keep islands apart so every island stays readable in the grid
+        if any((end[0] + x, end[1] + y) in degree for x, y in DIRECTIONS):
+            continue
+        used[end] = 'island'
+        degree[end] = 0
+        add_bridge((r, c), end, rng.choice([1, 2]))
+
+    # Extra bridges between islands that see each other through free cells
+    for a in sorted(degree):
+        for dr, dc in DIRECTIONS[1::2]:
+            x, y = a[0] + dr, a[1] + dc
+            while 0 <= x < rows and 0 <= y < cols and (x, y) not in degree:
+                x, y = x + dr, y + dc
+            b = (x, y)
+            if b not in degree:
+                continue
+            key = tuple(sorted((a, b)))
+            cells = path(a, b)
+            if bridges.get(key, 0) >= 2 or any(used.get(cell, key) != key for cell in cells):
+                continue
+            if degree[a] < 8 and degree[b] < 8 and rng.random() < extra_bridges:
+                add_bridge(a, b, 1)
+
+    matrix = [[0] * cols for _ in range(rows)]
+    for (r, c), d in degree.items():
+        matrix[r][c] = d
+    if len(degree) == 1:
+        # A lonely island cannot be solved, pair it with one neighbour cell
+        (r, c), = degree
+        dr, dc = next((dr, dc) for dr, dc in DIRECTIONS if 0 <= r + dr < rows and 0 <= c + dc < cols)
+        matrix[r][c] = matrix[r + dr][c + dc] = 1
+        bridges = {((r, c), (r + dr, c + dc)): 1}
+
+    coord_to_id = {(r, c): id for id, (r, c, _) in get_island_info(matrix).items()}
+    solution = {}
+    for (a, b), count in bridges.items():
+        i, j = sorted((coord_to_id[a], coord_to_id[b]))
+        solution[(i, j)] = count
+    return matrix, solution
+
+def write_puzzle(matrix, filename):
+    """
+    Write a matrix in the same layout as the files in Input/.
+    """
+    with open(filename, 'w') as f:
+        for row in matrix:
+            f.write(' , '.join(str(cell) for cell in row) + '\n')
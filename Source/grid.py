@@ -0,0 +1,50 @@
+import numpy as np
+
+# Columns of neighbour_ids
+UP, DOWN, LEFT, RIGHT = range(4)
+
+def island_arrays(matrix):
+    """
+    Get the islands of a matrix (lists or array) with one nonzero.
+      Output: (rows, cols, reqs) int arrays in row-major order, so island id = index + 1 like get_island_info
+    """
+    grid = np.asarray(matrix)
+    rows, cols = np.nonzero(grid)
+    return rows, cols, grid[rows, cols].astype(np.int64)
+
+def neighbour_ids(rows, cols):
+    """
+    Get the nearest island in each direction of every island, from the island coordinates only.
+    Every non-zero cell is an island, so the right neighbour of an island is the next island in row-major
+    order when it is on the same row, and the one below is the next in column-major order on the same column.
+      Input: rows, cols: output of island_arrays, or any coordinates (arrays or lists) in row-major order
+      Output: (n_islands, 4) int array, columns UP, DOWN, LEFT, RIGHT, 0 where there is no neighbour
+    """
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    ids = np.arange(1, len(rows) + 1)
+    neighbours = np.zeros((len(rows), 4), dtype=np.int64)
+    same_row = rows[1:] == rows[:-1]
+    neighbours[:-1, RIGHT] = np.where(same_row, ids[1:], 0)
+    neighbours[1:, LEFT] = np.where(same_row, ids[:-1], 0)
+    by_col = np.lexsort((rows, cols))
+    same_col = cols[by_col[1:]] == cols[by_col[:-1]]
+    neighbours[by_col[:-1], DOWN] = np.where(same_col, ids[by_col[1:]], 0)
+    neighbours[by_col[1:], UP] = np.where(same_col, ids[by_col[:-1]], 0)
+    return neighbours
+
+def bridge_capacity(rows, cols):
+    """
+    Most bridges each island can get: 2 per neighbour.
+      Output: int array, one entry per island in the order of island_arrays
+    """
+    return 2 * np.count_nonzero(neighbour_ids(rows, cols), axis=1)
+
+def over_capacity(matrix):
+    """
+    Find the islands that need more bridges than their neighbours allow, which makes the puzzle unsolvable.
+      Output: List of (row, col, required, capacity)
+    """
+    rows, cols, reqs = island_arrays(matrix)
+    capacity = bridge_capacity(rows, cols)
+    bad = reqs > capacity
+    return list(zip(rows[bad].tolist(), cols[bad].tolist(), reqs[bad].tolist(), capacity[bad].tolist()))
@@ -1,4 +1,6 @@
-from pysat.card import CardEnc
+from itertools import combinations
+from math import comb
+import bisect
 import os
 import time
 
@@ -8,14 +10,13 @@ def get_island_info(matrix):
       Input: Matrix
       Output: Dictionary: {island_id -> (row, col, required_bridges_number)}
     """
-    islands = {}
-    island_id = 1
-    for i, row in enumerate(matrix):
-        for j, cell in enumerate(row):
-            if cell != 0:
-                islands[island_id] = (i, j, cell)
-                island_id += 1
-    return islands
+    if isinstance(matrix, list):
+        # As fast as converting the lists to an array, and a solve does not have to import NumPy
+        cells = ((i, j, cell) for i, row in enumerate(matrix) for j, cell in enumerate(row) if cell != 0)
+        return dict(enumerate(cells, 1))
+    from grid import island_arrays
+    rows, cols, reqs = island_arrays(matrix)
+    return dict(enumerate(zip(rows.tolist(), cols.tolist(), reqs.tolist()), 1))
 
 def generate_bridge(islands, matrix):
     """
@@ -23,48 +24,28 @@ def generate_bridge(islands, matrix):
       Input: islands, matrix
       Output: edges: List of tuple (island_id_1, island_id_2, extra), extra represent how 2 island is connect. Ex: ('horizontal', row_index, start_col_index, end_col_index) ('vertical', col_index, start_row_index, end_row_index)
     """
-    bridges = []
     coord_to_id = {}
     for id, (r, c, required_bridge) in islands.items():
         coord_to_id[(r, c)] = id
 
-    row = len(matrix)
-    col = len(matrix[0])
+    # Nearest island to the right and below each island, from the coordinates alone like grid.neighbour_ids:
+    # every non-zero cell is an island, so it is the next island in row-major (column-major) order on the
+    # same row (column)
+    by_row = sorted(islands, key=lambda id: islands[id][:2])
+    right = {a: b for a, b in zip(by_row, by_row[1:]) if islands[a][0] == islands[b][0]}
+    by_col = sorted(islands, key=lambda id: (islands[id][1], islands[id][0]))
+    down = {a: b for a, b in zip(by_col, by_col[1:]) if islands[a][1] == islands[b][1]}
 
+    res = []
     for id, (r, c, required_bridge) in islands.items():
-        # Find bridge for each row
-        for next_c in range(c + 1, col):
-            if (r, next_c) in coord_to_id:
-                valid = True
-                for tmpC in range(c + 1, next_c):
-                    if (matrix[r][tmpC] != 0):
-                        valid = False
-                        break
-                if valid:
-                    id2 = coord_to_id[(r, next_c)]
-                    bridge = tuple(sorted((id, id2)))
-                    bridges.append( (bridge, ('horizontal', r, c, next_c)) )
-                break
-        # Find bridge for each col
-        for next_r in range(r + 1, row):
-            if (next_r, c) in coord_to_id:
-                valid = True
-                for tmpR in range(r + 1, next_r):
-                    if (matrix[tmpR][c] != 0):
-                        valid = False
-                        break
-                if valid:
-                    id2 = coord_to_id[(next_r, c)]
-                    bridge = tuple(sorted((id, id2)))
-                    bridges.append((bridge, ('vertical', c, r, next_r)))
-                break
-            
-    # Remove duplicate bridge
-    unique_bridge = {}
-    for (bridge, extra) in bridges:
-        if bridge not in unique_bridge:
-            unique_bridge[bridge] = extra
-    res = [(bridge[0], bridge[1], extra) for bridge, extra in unique_bridge.items()]
+        if id in right:
+            id2 = right[id]
+            bridge = tuple(sorted((id, id2)))
+            res.append((bridge[0], bridge[1], ('horizontal', r, c, islands[id2][1])))
+        if id in down:
+            id2 = down[id]
+            bridge = tuple(sorted((id, id2)))
+            res.append((bridge[0], bridge[1], ('vertical', c, r, islands[id2][0])))
     return res, coord_to_id
 
 def add_main_contraints(cnf, vpool, bridges):
@@ -80,9 +61,59 @@ def add_main_contraints(cnf, vpool, bridges):
         bridge_vars[(i, j)] = (x1, x2)
     return bridge_vars
 
-def add_island_contraints(cnf, vpool, islands, bridge_vars):
+# Cardinality encodings for add_island_contraints: the names of pysat.card.EncType, 'direct' lists the
+# forbidden subsets without auxiliary variables, 'auto' chooses per island with choose_card_encoding.
+# pysat.card is only imported once an island needs one of its encodings.
+CARD_ENCODINGS = ('seqcounter', 'sortnetwrk', 'cardnetwrk', 'totalizer', 'mtotalizer', 'kmtotalizer', 'direct', 'auto')
+CARD_ENCODING = 'auto'
+# Most clauses 'auto' accepts for a direct encoding before it falls back to AUTO_FALLBACK
+DIRECT_MAX_CLAUSES = 40
+AUTO_FALLBACK = 'seqcounter'
+
+def direct_clause_count(n, bound):
+    """
+    Number of clauses of the direct encoding of "exactly bound of n literals".
+    """
+    return comb(n, bound + 1) + comb(n, n - bound + 1)
+
+def direct_equals(lits, bound):
+    """
+    Encode "exactly bound of lits are true" without auxiliary variables:
+    no bound + 1 literals are all true, and no n - bound + 1 literals are all false.
+    """
+    clauses = [[-lit for lit in subset] for subset in combinations(lits, bound + 1)]
+    clauses.extend(list(subset) for subset in combinations(lits, len(lits) - bound + 1))
+    return clauses
+
+def choose_card_encoding(n, bound):
+    """
+    Encoding 'auto' uses for an island with n literals and the given requirement.
+    """
+    if direct_clause_count(n, bound) <= DIRECT_MAX_CLAUSES:
+        return 'direct'
+    return AUTO_FALLBACK
+
+def island_clauses(vpool, lits, require, encoding=None):
+    """
+    Clauses of one island: exactly require of lits (the x1 and x2 of its bridges) are true.
+    encoding: a name from CARD_ENCODINGS, CARD_ENCODING when None.
+    """
+    if encoding is None:
+        encoding = CARD_ENCODING
+    if len(lits) >= require and require > 0:
+        chosen = choose_card_encoding(len(lits), require) if encoding == 'auto' else encoding
+        if chosen == 'direct':
+            return direct_equals(lits, require)
+        from pysat.card import CardEnc, EncType
+        return CardEnc.equals(lits=lits, bound=require, vpool=vpool, encoding=getattr(EncType, chosen)).clauses
+    if require == 0:
+        return [[-lit] for lit in lits]
+    return [[]]
+
+def add_island_contraints(cnf, vpool, islands, bridge_vars, encoding=None):
     """
     Constraint: For each island, the total number of bridge link to it equal its value.
+    encoding: a name from CARD_ENCODINGS, CARD_ENCODING when None.
     """
     required_bridge = {id: [] for id in islands.keys()}
     for (i, j), (x1, x2) in bridge_vars.items():
@@ -91,86 +122,148 @@ def add_island_contraints(cnf, vpool, islands, bridge_vars):
         if j in required_bridge:
             required_bridge[j].extend([x1, x2])
     for id, lits in required_bridge.items():
-        require = islands[id][2]
-        if len(lits) >= require and require > 0:
-            card = CardEnc.equals(lits=lits, bound=require, vpool=vpool, encoding=1)
-            cnf.extend(card.clauses)
-        elif require == 0:
-            for lit in lits:
-                cnf.append([-lit])
-        else:
-            cnf.append([])
+        cnf.extend(island_clauses(vpool, lits, islands[id][2], encoding))
     return
 
-def count_possible_bridges(grid, row, col):
-    R, C = len(grid), len(grid[0])
-    directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]  # up, down, left, right
-    count = 0
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-        while 0 <= r < R and 0 <= c < C:
-            if grid[r][c] > 0:
-                count += 1
-                break
-            elif grid[r][c] == 0:
-                r += dr
-                c += dc
-            else:
-                break
-    return count
+def get_crossing_pairs(bridges):
+    """
+    Find every pair of bridges that cross each other.
+    Sweep the rows from top to bottom, keeping the vertical bridges that span the current row sorted by column,
+    so each horizontal bridge only looks at the vertical bridges it really crosses.
+      Input: bridges (output of generate_bridge)
+      Output: List of (index_1, index_2) into bridges, index_1 < index_2, sorted
+    """
+    horizontal_at = {}
+    opened_at = {}
+    closed_at = {}
+    for idx, (i, j, extra) in enumerate(bridges):
+        kind, line, start, end = extra
+        if end - start < 2:
+            continue
+        if kind == 'horizontal':
+            horizontal_at.setdefault(line, []).append(idx)
+        else:
+            opened_at.setdefault(start + 1, []).append(idx)
+            closed_at.setdefault(end, []).append(idx)
+
+    pairs = []
+    active_cols = []
+    active = {}
+    for r in sorted(set(horizontal_at) | set(opened_at) | set(closed_at)):
+        for idx in closed_at.get(r, ()):
+            c = bridges[idx][2][1]
+            del active_cols[bisect.bisect_left(active_cols, c)]
+            del active[c]
+        for idx in opened_at.get(r, ()):
+            c = bridges[idx][2][1]
+            bisect.insort(active_cols, c)
+            active[c] = idx
+        if not active_cols:
+            continue
+        for idx in horizontal_at.get(r, ()):
+            start_c, end_c = bridges[idx][2][2], bridges[idx][2][3]
+            k = bisect.bisect_right(active_cols, start_c)
+            while k < len(active_cols) and active_cols[k] < end_c:
+                other = active[active_cols[k]]
+                pairs.append((min(idx, other), max(idx, other)))
+                k += 1
+    pairs.sort()
+    return pairs
 
 def add_non_crossing_constraints(cnf, vpool, bridges):
     """
     There are no vertical and horizontal bridge cross.
     """
-    bridge_list = [((i, j), extra) for (i, j, extra) in bridges]
-    n = len(bridge_list)
-
-    for i in range(n):
-        (bridge1, extra1) = bridge_list[i]
-        for j in range(i + 1, n):
-            (bridge2, extra2) = bridge_list[j]
-            if extra1[0] == 'horizontal' and extra2[0] == 'vertical':
-                r = extra1[1]
-                start_c, end_c = extra1[2], extra1[3]
-                c = extra2[1]
-                start_r, end_r = extra2[2], extra2[3]
-                if start_r < r < end_r and start_c < c < end_c:
-                    x1_e1 = vpool.id(('x', bridge1[0], bridge1[1], 1))
-                    x1_e2 = vpool.id(('x', bridge2[0], bridge2[1], 1))
-                    cnf.append([-x1_e1, -x1_e2])
-            elif extra1[0] == 'vertical' and extra2[0] == 'horizontal':
-                r = extra2[1]
-                start_c, end_c = extra2[2], extra2[3]
-                c = extra1[1]
-                start_r, end_r = extra1[2], extra1[3]
-                if start_r < r < end_r and start_c < c < end_c:
-                    x1_e1 = vpool.id(('x', bridge1[0], bridge1[1], 1))
-                    x1_e2 = vpool.id(('x', bridge2[0], bridge2[1], 1))
-                    cnf.append([-x1_e1, -x1_e2])
+    for i, j in get_crossing_pairs(bridges):
+        bridge1, bridge2 = bridges[i], bridges[j]
+        x1_e1 = vpool.id(('x', bridge1[0], bridge1[1], 1))
+        x1_e2 = vpool.id(('x', bridge2[0], bridge2[1], 1))
+        cnf.append([-x1_e1, -x1_e2])
     return
 
+class ConnectivityChecker:
+    """
+    Connectivity of the islands of one puzzle under any set of bridges.
+    The union-find arrays are built once and reset in place, so the checks in the solver loops
+    allocate nothing and never recurse.
+    """
+    def __init__(self, islands):
+        self.ids = list(islands.keys())
+        size = max(self.ids, default=0) + 1
+        self.parent = list(range(size))
+        self._identity = list(range(size))
+        self.n_components = len(self.ids)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def count(self, pairs):
+        """
+        Join the islands of every bridge in pairs, starting from no bridge at all.
+          Input: pairs: iterable of (island_id_1, island_id_2), a solution dictionary works as is
+          Output: number of components, kept for components()
+        """
+        parent = self.parent
+        parent[:] = self._identity
+        find = self.find
+        n = len(self.ids)
+        for i, j in pairs:
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[ri] = rj
+                n -= 1
+                if n == 1:
+                    break
+        self.n_components = n
+        return n
+
+    def connected(self, pairs):
+        return self.count(pairs) <= 1
+
+    def components(self):
+        """
+        The components found by the last count().
+          Output: List of sets of island ids, one set per component
+        """
+        groups = {}
+        for id in self.ids:
+            groups.setdefault(self.find(id), set()).add(id)
+        return list(groups.values())
+
 def check_connect(solution, islands):
     """
-    Check all the island is connect using DFS.
+    Check all the island is connect.
+    """
+    return ConnectivityChecker(islands).connected(key for key, count in solution.items() if count > 0)
+
+def check_solution(solution, islands):
+    """
+    Check a solution: every island gets exactly its number of bridges, each pair has 1 or 2 bridges
+    and all the islands are connected.
     """
-    # Init adjacency list
-    graph = {i: [] for i in islands.keys()}
+    degree = {id: 0 for id in islands.keys()}
     for (i, j), count in solution.items():
-        if count > 0:
-            graph[i].append(j)
-            graph[j].append(i)
-    visited = set()
-
-    def dfs(u):
-        visited.add(u)
-        for v in graph[u]:
-            if v not in visited:
-                dfs(v)
-    
-    start = min(islands.keys())
-    dfs(start)
-    return len(visited) == len(islands)
+        if count not in (1, 2) or i not in degree or j not in degree:
+            return False
+        degree[i] += count
+        degree[j] += count
+    if any(degree[id] != req for id, (r, c, req) in islands.items()):
+        return False
+    return check_connect(solution, islands)
+
+def get_components(solution, islands):
+    """
+    Get the connected components of the islands under a solution.
+      Input: solution: {(island_id_1, island_id_2) -> count}, islands
+      Output: List of sets of island ids, one set per component
+    """
+    checker = ConnectivityChecker(islands)
+    checker.count(key for key, count in solution.items() if count > 0)
+    return checker.components()
 
 def get_n_vars(cnf):
     """
@@ -183,13 +276,13 @@ def get_n_vars(cnf):
             n = max(n, abs(lit))
     return n
 
-def interpret_model(assignment, bridge_vars):
+def interpret_model(assignment, bridge_vars, fixed=None):
     """ 
     Interpret the model to get the solution in a readable format.
-    Input: assignment (list of boolean values), bridge_vars): (dictionary of edge variables)
+    Input: assignment (list of boolean values), bridge_vars): (dictionary of edge variables), fixed: bridges decided before the search
     Output: solution (dictionary of edges with their counts)
     """
-    sol = {}
+    sol = dict(fixed) if fixed else {}
     for key, (x1, x2) in bridge_vars.items():
         if assignment[x1]:
             count = 1
@@ -206,7 +299,11 @@ def read_file(filename):
             matrix.append(r)
     return matrix
 
-def print_result(matrix, islands, solution, filename):
+def render_result(matrix, islands, solution):
+    """
+    Draw a solution as a character grid: island numbers, '-'/'=' for horizontal and '|'/'$' for vertical bridges.
+      Output: List of rows, each a list of 1-character strings
+    """
     rows = len(matrix)
     cols = len(matrix[0])
     output = [['0' for _ in range(cols)] for _ in range(rows)]
@@ -226,7 +323,10 @@ def print_result(matrix, islands, solution, filename):
             c = c1
             for r in range(min(r1, r2) + 1, max(r1, r2)):
                 output[r][c] = '|' if count == 1 else '$'
+    return output
 
+def print_result(matrix, islands, solution, filename):
+    output = render_result(matrix, islands, solution)
     with open(filename, 'w') as f:
         for r in output: 
             f.write(' '.join(r) + '\n')
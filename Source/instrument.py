@@ -0,0 +1,267 @@
+import math
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Default for Profile(trace_memory=None). tracemalloc slows down allocation-heavy solvers a lot,
+# so it is only turned on for a dedicated memory pass (--trace-memory).
+TRACE_MEMORY = False
+
+PHASES = ['parse', 'bridges', 'preprocess', 'encoding', 'search', 'connectivity']
+
+# Defaults of Budget(), None = no limit: seconds, search nodes, and KB of memory the solve may add to the RSS
+# of the process when it starts (traced memory when tracemalloc is on), like the peak of Profile
+TIME_LIMIT = None
+NODE_LIMIT = None
+MEMORY_LIMIT = None
+# Nodes between two looks at the clock and the memory
+CHECK_EVERY = 256
+# Processes one solve may start (the pools of cube-and-conquer and of the parallel brute force), the WORKERS
+# of the solver when None. The batch runner, the race and the service set it to 1 in their children, which
+# already solve side by side
+POOL_WORKERS = None
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+# Profiles started and not stopped yet, measuring RSS
+_running = set()
+
+class Profile:
+    """
+    Time spent in each phase of a solve, and the peak memory.
+    Phases are exclusive: entering a phase pauses the enclosing one, so the phases add up to the total.
+    Memory is the tracemalloc peak when trace_memory is on. Otherwise it is the peak RSS during the solve
+    above the RSS at start(), so what an earlier solve of the same process (or the parent of a forked
+    child) used does not count. On Linux the kernel keeps the peak, reset at start(); elsewhere the RSS
+    is sampled at every Budget.check and phase change.
+    """
+    def __init__(self, trace_memory=None):
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.phases = {}
+        # Sizes of the solved formula: 'vars' and 'clauses', 'decided' bridges of the preprocessing, and the
+        # 'iterations' (SAT calls) and 'cuts' of the connectivity loop
+        self.counters = {}
+        self.start_time = None
+        self.elapsed = 0.0
+        self.peak_kb = 0.0
+        self._stack = []
+        self._mark = None
+        self._baseline_kb = 0.0
+        self._rss_peak_kb = 0.0
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        else:
+            self._baseline_kb = memory_kb()
+            self._rss_peak_kb = self._baseline_kb
+            reset_peak_rss()
+            _running.add(self)
+        self.start_time = time.perf_counter()
+        self._mark = self.start_time
+
+    def sample(self, kb):
+        self._rss_peak_kb = max(self._rss_peak_kb, kb)
+
+    def stop(self):
+        """
+        Output: (elapsed seconds since start, peak memory in KB)
+        """
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak_kb = peak / 1024
+        else:
+            _running.discard(self)
+            self.sample(peak_rss_kb())
+            self.peak_kb = max(0.0, self._rss_peak_kb - self._baseline_kb)
+        return self.elapsed, self.peak_kb
+
+    @contextmanager
+    def phase(self, name):
+        if _running and _peak_reset is False:
+            sample_memory()
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.phases[parent] = self.phases.get(parent, 0.0) + now - self._mark
+        self._stack.append(name)
+        self._mark = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._mark
+            self._stack.pop()
+            self._mark = now
+
+    def count_formula(self, cnf):
+        self.counters['vars'] = cnf.nv
+        self.counters['clauses'] = len(cnf.clauses)
+
+    def count_decided(self, decided):
+        self.counters['decided'] = decided
+
+    def count_search(self, stats):
+        self.counters['iterations'] = stats['iterations']
+        self.counters['cuts'] = stats['cuts']
+
+    def format(self):
+        """
+        One line with the time of every phase that was used, then the formula size and the connectivity loop
+        counts when there are some.
+        """
+        parts = [f'{name} {self.phases[name]:.4f}s' for name in PHASES if name in self.phases]
+        parts += [f'{value} {name}' for name, value in self.counters.items()]
+        return ' | '.join(parts)
+
+class BudgetExceeded(Exception):
+    """
+    Raised inside a search when its Budget runs out, status is 'timeout' or 'memout'.
+    """
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+class Budget:
+    """
+    Limits of one solve. Solvers call step() once per search node (a decision, an expansion, an assignment);
+    running out of time or nodes raises BudgetExceeded('timeout'), running out of memory BudgetExceeded('memout').
+    The clock starts with start(), so a Budget is used for a single solve.
+    """
+    def __init__(self, time_limit=None, node_limit=None, memory_limit=None):
+        self.time_limit = TIME_LIMIT if time_limit is None else time_limit
+        self.node_limit = NODE_LIMIT if node_limit is None else node_limit
+        self.memory_limit = MEMORY_LIMIT if memory_limit is None else memory_limit
+        self.nodes = 0
+        self.deadline = None
+        self.baseline_kb = 0.0
+        self._next_check = CHECK_EVERY
+
+    def start(self):
+        if self.time_limit is not None:
+            self.deadline = time.perf_counter() + self.time_limit
+        if self.memory_limit is not None:
+            self.baseline_kb = memory_kb()
+
+    def remaining(self):
+        """
+        Seconds left, None without a time limit.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def step(self, nodes=1):
+        self.nodes += nodes
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise BudgetExceeded('timeout')
+        if self.nodes >= self._next_check:
+            self._next_check = self.nodes + CHECK_EVERY
+            self.check()
+
+    def check(self):
+        if _running and _peak_reset is False:
+            sample_memory()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise BudgetExceeded('timeout')
+        if self.memory_limit is not None and memory_kb() - self.baseline_kb > self.memory_limit:
+            raise BudgetExceeded('memout')
+
+def memory_kb():
+    """
+    Memory in use: traced memory when tracemalloc runs, otherwise the current RSS of the process (Linux),
+    the peak RSS elsewhere, 0 if unknown.
+    """
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0] / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return 0.0
+
+# Whether /proc/self/clear_refs resets the peak RSS, None until tried
+_peak_reset = None
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return float(line.split()[1])
+    raise ValueError(field)
+
+def reset_peak_rss():
+    """
+    Start a new peak RSS (Linux VmHWM), after giving the current one to the running profiles.
+      Output: whether the peak could be reset; peak_rss_kb() is the current RSS when it could not
+    """
+    global _peak_reset
+    if _peak_reset is False:
+        return False
+    peak = peak_rss_kb() if _running else 0.0
+    for profile in _running:
+        profile.sample(peak)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _peak_reset = True
+    except OSError:
+        _peak_reset = False
+    return _peak_reset
+
+def peak_rss_kb():
+    """
+    Peak RSS since the last reset_peak_rss(), or the current RSS when the peak cannot be reset.
+    """
+    if _peak_reset:
+        try:
+            return _status_kb('VmHWM')
+        except (OSError, ValueError):
+            pass
+    return memory_kb()
+
+def sample_memory():
+    """
+    Give the current RSS to the running profiles, where the kernel does not keep the peak for them.
+    """
+    current = memory_kb()
+    for profile in _running:
+        profile.sample(current)
+
+def solve_status(stats):
+    """
+    Status of a finished solve for reports: 'solved', 'no solution', 'timeout' or 'memout'.
+    """
+    return {'unsat': 'no solution'}.get(stats['status'], stats['status'])
+
+def run_search(search, budget, stats):
+    """
+    Run a search under its budget and record how it ended.
+      Input: search: function without arguments returning a solution or None, budget, stats dictionary
+      Output: the solution, None when there is none or the budget ran out
+              stats['status'] is 'solved', 'unsat', 'timeout' or 'memout', stats['nodes'] the nodes used
+    """
+    try:
+        solution = search()
+        stats['status'] = 'unsat' if solution is None else 'solved'
+    except BudgetExceeded as e:
+        solution = None
+        stats['status'] = e.status
+    stats['nodes'] = budget.nodes
+    return solution
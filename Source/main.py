@@ -1,14 +1,18 @@
-from helper import count_files_in_directory, read_file, count_possible_bridges, print_result
-from pysat_solution import solve_with_pysat
-from backtrack_solution import solve_with_back_track
-from a_start_solution import solve_with_a_star
-from brute_force_solution import solve_with_brute_force
+from helper import count_files_in_directory, read_file, print_result
+from instrument import Profile, solve_status
+import instrument
+import helper
+import preprocess
+from batch import find_puzzles, run_batch, format_summary, write_impossible_islands
+from registry import methods, all_methods, find_method
+import argparse
 import os
 
-INPUT_DIR = os.path.join(os.path.dirname(__file__), 'input')
+INPUT_DIR = os.path.join(os.path.dirname(__file__), 'Input')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
 
 def main():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     num_files = count_files_in_directory(INPUT_DIR)
     for idx in range(num_files): 
         file_name = f'input-{idx + 1}.txt' if idx >= 9 else f'input-0{idx + 1}.txt'
@@ -22,46 +26,65 @@ def main():
         print("3. Brute-force")
         print("4. pySAT")
         print("5. Run all methods")
+        print("6. Native")
+        print("7. Race all methods (first correct solution wins)")
+        print("8. Check the solution is unique (pySAT)")
+        print("9. Cube-and-conquer (pySAT on every core)")
         
-        choice = input("Enter your choice (1-5): ").strip()
+        choice = input("Enter your choice (1-9): ").strip()
 
-        matrix = read_file(input_path)
-
-        with open(output_path, 'w') as fout:
-            for i in range(len(matrix)):
-                for j in range(len(matrix[0])):
-                    if matrix[i][j] > 0:
-                        possible = count_possible_bridges(matrix, i, j)
-                        if possible < matrix[i][j]:
-                            fout.write(f"Island at ({i},{j}) requires {matrix[i][j]} bridges but only {possible} possible.\n")
-
-        methods = {
-            "1": ("A*", solve_with_a_star),
-            "2": ("Backtracking", solve_with_back_track),
-            "3": ("Brute-force", solve_with_brute_force),
-            "4": ("pySAT", solve_with_pysat),
-        }
+        parse_profile = Profile()
+        with parse_profile.phase('parse'):
+            matrix = read_file(input_path)
+        print(parse_profile.format())
+        write_impossible_islands(matrix, output_path)
 
         results = []
 
         if choice == "5":
-            for name, func in methods.values():
+            for name, func in all_methods():
                 try:
-                    solution, islands, bridges, t, mem = func(matrix)
+                    profile = Profile()
+                    stats = {}
+                    solution, islands, bridges, t, mem = func(matrix, profile=profile, stats=stats)
                     print(f"{name}: {t:.4f}s | {mem:.2f} KB")
+                    print(f"  {profile.format()}")
                     if solution is None:
-                        print(f"{name}: No solution found.")
+                        print(f"{name}: No solution found ({solve_status(stats)}).")
                     else:
                         results.append((name, solution, islands, bridges, t, mem))
                 except Exception as e:
                     print(f"{name} failed: {e}")
+        elif choice == "7":
+            from race import solve_with_race
+            winner, solution, islands, bridges, reports = solve_with_race(matrix, all_methods())
+            for name, status, t in reports:
+                print(f"{name}: {status} after {t:.4f}s")
+            if winner is None:
+                print("Race: No solution found.")
+            else:
+                t = next(t for name, status, t in reports if name == winner)
+                print(f"Race winner: {winner} ({t:.4f}s)")
+                results.append((winner, solution, islands, bridges, t, None))
+        elif choice == "8":
+            from pysat_solution import check_unique
+            status, solutions, islands, bridges, t, mem = check_unique(matrix)
+            if status in ('timeout', 'memout'):
+                print(f"Uniqueness: unknown, {status} after {len(solutions)} solution(s) ({t:.4f}s)")
+            else:
+                print(f"Uniqueness: {status} ({t:.4f}s)")
+            if solutions:
+                results.append(("pySAT", solutions[0], islands, bridges, t, mem))
         elif choice in methods:
             name, func = methods[choice]
             try:
-                solution, islands, bridges, t, mem = func(matrix)
+                profile = Profile()
+                stats = {}
+                solution, islands, bridges, t, mem = func(matrix, profile=profile, stats=stats)
                 print(f"{name}: {t:.4f}s | {mem:.2f} KB")
+                print(f"  {profile.format()}")
                 if solution is None:
-                    print(f"{name}: No solution found.")
+                    print(f"{name}: No solution found ({solve_status(stats)}).")
                 else:
                     results.append((name, solution, islands, bridges, t, mem))
             except Exception as e:
@@ -77,5 +100,54 @@ def main():
             best = min(results, key=lambda x: x[4])  
             print_result(matrix, best[2], best[1], output_path)
 
+def batch_main(args):
+    """
+    Solve every puzzle matched by args.puzzles without asking anything, then write a summary table.
+    """
+    method = find_method(args.solver)
+    if method is None:
+        raise SystemExit(f"Unknown solver: {args.solver}")
+    name, func = method
+    if args.workers < 1:
+        raise SystemExit(f"--workers must be at least 1, got {args.workers}")
+    paths = find_puzzles(args.puzzles)
+    if not paths:
+        raise SystemExit(f"No puzzle found for {args.puzzles}")
+
+    results = run_batch(paths, func, args.workers, args.timeout, args.output)
+    summary = format_summary(name, results)
+    print(summary, end='')
+    with open(os.path.join(args.output, 'summary.txt'), 'w') as f:
+        f.write(summary)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hashiwokakero solver. Without --batch, asks for a method for every file in Input/.")
+    parser.add_argument('--batch', dest='puzzles', help="directory or glob of puzzle files to solve without prompting")
+    parser.add_argument('--solver', default='pysat', help="astar, backtracking, bruteforce, pysat, native, cube or a menu number (default: pysat)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of puzzles solved at the same time")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds allowed per puzzle before it is killed")
+    parser.add_argument('--output', default='output', help="directory for the results (default: output)")
+    parser.add_argument('--cache-dir', default=None, help="also keep the CNF encodings on disk, in DIMACS, to reuse them on later runs")
+    parser.add_argument('--no-preprocess', action='store_true', help="do not fix the forced bridges before solving")
+    parser.add_argument('--card-encoding', default=helper.CARD_ENCODING, choices=sorted(helper.CARD_ENCODINGS), help="cardinality encoding of the island constraints (default: %(default)s)")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds a solver may search before it gives up with 'timeout'")
+    parser.add_argument('--node-limit', type=int, default=None, help="search nodes a solver may use before it gives up with 'timeout'")
+    parser.add_argument('--memory-limit', type=float, default=None, help="KB of memory a solve may add before it gives up with 'memout'")
+    parser.add_argument('--trace-memory', action='store_true', help="measure memory with tracemalloc (slower) instead of the peak RSS of each solve")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    instrument.TRACE_MEMORY = args.trace_memory
+    instrument.TIME_LIMIT = args.time_limit
+    instrument.NODE_LIMIT = args.node_limit
+    instrument.MEMORY_LIMIT = args.memory_limit
+    helper.CARD_ENCODING = args.card_encoding
+    preprocess.PREPROCESS = not args.no_preprocess
+    if args.cache_dir:
+        from encoding_cache import set_cache_dir
+        set_cache_dir(args.cache_dir)
+    if args.puzzles:
+        batch_main(args)
+    else:
+        main()
@@ -0,0 +1,226 @@
+from helper import get_island_info, generate_bridge, get_crossing_pairs
+from instrument import Profile, Budget, run_search
+
+# Trail entry kinds, used to undo changes on backtrack
+LOWER, UPPER, MERGE, REMAIN = range(4)
+
+def solve_with_native(matrix, profile=None, stats=None, budget=None):
+    """
+    Solve Hashiwokakero directly on the bridge list, without any CNF encoding.
+    Every bridge keeps a domain lo..hi inside {0, 1, 2} and every island a remaining-degree counter.
+    Domains are narrowed by island saturation / forced doubles, crossing elimination and
+    union-find connectivity pruning, then the search branches on the undecided bridges.
+      stats: optional dictionary, filled with 'status', 'nodes' (values tried) and 'max_depth'
+      budget: optional instrument.Budget, a new Budget() with the default limits when None
+    """
+    if profile is None:
+        profile = Profile()
+    if stats is None:
+        stats = {}
+    if budget is None:
+        budget = Budget()
+    stats['max_depth'] = 0
+    profile.start()
+    budget.start()
+
+    with profile.phase('bridges'):
+        islands = get_island_info(matrix)
+        bridges, coord_to_id = generate_bridge(islands, matrix)
+    with profile.phase('search'):
+        solution = run_search(lambda: search(islands, bridges, stats, budget) if islands else None, budget, stats)
+
+    elapsed, peak = profile.stop()
+    if solution is not None:
+        return solution, islands, bridges, elapsed, peak
+    else:
+        return None, None, None, elapsed, peak
+
+def search(islands, bridges, stats, budget):
+    """
+    Depth-first search over the bridge domains.
+      Input: islands, bridges, stats, budget
+      Output: solution: {(island_id_1, island_id_2) -> count}, or None if there is no solution
+    """
+    n_islands = len(islands)
+    n_edges = len(bridges)
+    require = [0] * (n_islands + 1)
+    incident = [[] for _ in range(n_islands + 1)]
+    for id, (r, c, req) in islands.items():
+        require[id] = req
+    ends = []
+    for e, (i, j, extra) in enumerate(bridges):
+        ends.append((i, j))
+        incident[i].append(e)
+        incident[j].append(e)
+    crossing = [[] for _ in range(n_edges)]
+    for e, f in get_crossing_pairs(bridges):
+        crossing[e].append(f)
+        crossing[f].append(e)
+
+    lo = [0] * n_edges
+    hi = [min(2, require[i], require[j]) for (i, j) in ends]
+
+    # Union-find over the bridges already built (lo > 0), without path compression so merges can be undone.
+    # remain[root]: bridges the whole component still has to build
+    parent = list(range(n_islands + 1))
+    size = [1] * (n_islands + 1)
+    remain = require[:]
+
+    trail = []
+    queue = []
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def set_lo(e, v):
+        if v > hi[e]:
+            return False
+        if v <= lo[e]:
+            return True
+        added = v - lo[e]
+        trail.append((LOWER, e, lo[e]))
+        lo[e] = v
+        a, b = ends[e]
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            trail.append((REMAIN, ra, remain[ra]))
+            remain[ra] -= 2 * added
+            root = ra
+        else:
+            if size[ra] < size[rb]:
+                ra, rb = rb, ra
+            trail.append((MERGE, rb, ra, remain[ra]))
+            parent[rb] = ra
+            size[ra] += size[rb]
+            remain[ra] += remain[rb] - 2 * added
+            root = ra
+        # A finished component that does not hold every island can never be connected
+        if remain[root] < 0 or (remain[root] == 0 and size[root] < n_islands):
+            return False
+        queue.append(a)
+        queue.append(b)
+        for f in crossing[e]:
+            if not set_hi(f, 0):
+                return False
+        return True
+
+    def set_hi(e, v):
+        if v < lo[e]:
+            return False
+        if v >= hi[e]:
+            return True
+        trail.append((UPPER, e, hi[e]))
+        hi[e] = v
+        queue.extend(ends[e])
+        return True
+
+    def propagate():
+        while queue:
+            i = queue.pop()
+            sum_lo = sum(lo[e] for e in incident[i])
+            sum_hi = sum(hi[e] for e in incident[i])
+            req = require[i]
+            if sum_lo > req or sum_hi < req:
+                return False
+            for e in incident[i]:
+                # Forced bridges: the other bridges cannot reach the requirement on their own
+                if not set_lo(e, req - (sum_hi - hi[e])):
+                    return False
+                # Saturation: the island cannot take more than what is left
+                if not set_hi(e, req - (sum_lo - lo[e])):
+                    return False
+                # Isolation: raising the bridge to hi would close a component that misses some islands
+                if lo[e] < hi[e]:
+                    a, b = ends[e]
+                    ra, rb = find(a), find(b)
+                    if ra == rb:
+                        total, joined = remain[ra], size[ra]
+                    else:
+                        total, joined = remain[ra] + remain[rb], size[ra] + size[rb]
+                    if joined < n_islands and total - 2 * (hi[e] - lo[e]) <= 0:
+                        if not set_hi(e, hi[e] - 1):
+                            return False
+        return True
+
+    def can_connect():
+        """
+        Check the islands can still be connected using the bridges with hi > 0.
+        """
+        graph = [[] for _ in range(n_islands + 1)]
+        for e, (i, j) in enumerate(ends):
+            if hi[e] > 0:
+                graph[i].append(j)
+                graph[j].append(i)
+        visited = [False] * (n_islands + 1)
+        visited[1] = True
+        stack = [1]
+        count = 1
+        while stack:
+            for v in graph[stack.pop()]:
+                if not visited[v]:
+                    visited[v] = True
+                    count += 1
+                    stack.append(v)
+        return count == n_islands
+
+    def undo(length):
+        while len(trail) > length:
+            entry = trail.pop()
+            if entry[0] == LOWER:
+                lo[entry[1]] = entry[2]
+            elif entry[0] == UPPER:
+                hi[entry[1]] = entry[2]
+            elif entry[0] == REMAIN:
+                remain[entry[1]] = entry[2]
+            else:
+                kind, child, root, old_remain = entry
+                parent[child] = child
+                size[root] -= size[child]
+                remain[root] = old_remain
+
+    def pick_bridge():
+        """
+        Pick an undecided bridge at the island with the fewest undecided bridges.
+        """
+        best, best_count = None, None
+        for e in range(n_edges):
+            if lo[e] == hi[e]:
+                continue
+            for i in ends[e]:
+                count = sum(1 for f in incident[i] if lo[f] < hi[f])
+                if best is None or count < best_count:
+                    best, best_count = e, count
+            if best_count == 1:
+                break
+        return best
+
+    queue.extend(range(1, n_islands + 1))
+    ok = propagate() and can_connect()
+
+    # Each frame: (bridge, values still to try, trail length before the decision)
+    stack = []
+    while True:
+        if ok:
+            e = pick_bridge()
+            if e is None:
+                if size[find(1)] == n_islands:
+                    return {ends[e]: lo[e] for e in range(n_edges) if lo[e] > 0}
+                ok = False
+                continue
+            stack.append((e, list(range(lo[e], hi[e] + 1)), len(trail)))
+            if len(stack) > stats['max_depth']:
+                stats['max_depth'] = len(stack)
+        else:
+            while stack and not stack[-1][1]:
+                stack.pop()
+            if not stack:
+                return None
+        e, values, length = stack[-1]
+        undo(length)
+        queue.clear()
+        # Try the larger value first, like the other solvers placing bridges first
+        v = values.pop()
+        budget.step()
+        ok = set_lo(e, v) and set_hi(e, v) and propagate() and can_connect()
@@ -0,0 +1,148 @@
+from helper import get_crossing_pairs
+
+# Run preprocess_bridges before encoding or searching, off with --no-preprocess
+PREPROCESS = True
+
+def preprocess_bridges(islands, bridges):
+    """
+    Decide the bridges that the puzzle rules force, in polynomial time and before any encoding or search.
+    Every bridge starts with the domain 0..min(2, requirements of its islands). The rules below
+    narrow the domains until nothing changes:
+      - Forced: the other bridges of an island cannot reach its requirement, so this one needs at least
+        the difference (an 8, a 1 with a single neighbour, 3 neighbours for a 6, ...)
+      - Capacity: an island that already has its requirement caps its other bridges
+      - Crossing: a bridge that is built removes every bridge crossing it
+      - Isolation: a bridge that would close a component without all the islands is lowered (two 1s, two 2s)
+      Input: islands, bridges (output of generate_bridge)
+      Output: (fixed, residual, domains), or None when a rule proves there is no solution
+        fixed: {(island_id_1, island_id_2) -> count} of the decided bridges with count > 0
+        residual: the undecided bridges, in the order of bridges
+        domains: {(island_id_1, island_id_2) -> (lo, hi)} of the undecided bridges
+    """
+    n_islands = len(islands)
+    require = {id: req for id, (r, c, req) in islands.items()}
+    incident = {id: [] for id in islands.keys()}
+    for e, (i, j, extra) in enumerate(bridges):
+        incident[i].append(e)
+        incident[j].append(e)
+    crossing = [[] for _ in bridges]
+    for e, f in get_crossing_pairs(bridges):
+        crossing[e].append(f)
+        crossing[f].append(e)
+
+    lo = [0] * len(bridges)
+    hi = [min(2, require[i], require[j]) for (i, j, extra) in bridges]
+
+    # Components of the built bridges (lo > 0), with the bridges each one still has to build
+    parent = {id: id for id in islands.keys()}
+    size = {id: 1 for id in islands.keys()}
+    remain = dict(require)
+    queue = list(islands.keys())
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def raise_lo(e, v):
+        i, j, extra = bridges[e]
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            if size[ri] < size[rj]:
+                ri, rj = rj, ri
+            parent[rj] = ri
+            size[ri] += size[rj]
+            remain[ri] += remain[rj]
+        remain[ri] -= 2 * (v - lo[e])
+        lo[e] = v
+        queue.extend((i, j))
+        if remain[ri] < 0 or (remain[ri] == 0 and size[ri] < n_islands):
+            return False
+        for f in crossing[e]:
+            if lo[f] > 0:
+                return False
+            if hi[f] > 0:
+                lower_hi(f, 0)
+        return True
+
+    def lower_hi(e, v):
+        hi[e] = v
+        queue.extend(bridges[e][:2])
+
+    def isolated(e):
+        """
+        Building e up to hi would close a component that misses some islands.
+        """
+        i, j, extra = bridges[e]
+        ri, rj = find(i), find(j)
+        if ri == rj:
+            total, joined = remain[ri], size[ri]
+        else:
+            total, joined = remain[ri] + remain[rj], size[ri] + size[rj]
+        return joined < n_islands and total - 2 * (hi[e] - lo[e]) <= 0
+
+    while queue:
+        while queue:
+            id = queue.pop()
+            req = require[id]
+            sum_lo = sum(lo[e] for e in incident[id])
+            sum_hi = sum(hi[e] for e in incident[id])
+            if sum_lo > req or sum_hi < req:
+                return None
+            for e in incident[id]:
+                if lo[e] == hi[e]:
+                    continue
+                new_lo = req - (sum_hi - hi[e])
+                new_hi = req - (sum_lo - lo[e])
+                if new_hi < hi[e]:
+                    if new_hi < lo[e]:
+                        return None
+                    sum_hi -= hi[e] - new_hi
+                    lower_hi(e, new_hi)
+                if new_lo > lo[e]:
+                    if new_lo > hi[e]:
+                        return None
+                    sum_lo += new_lo - lo[e]
+                    if not raise_lo(e, new_lo):
+                        return None
+                if lo[e] < hi[e] and isolated(e):
+                    sum_hi -= 1
+                    lower_hi(e, hi[e] - 1)
+        # Merges elsewhere change the components, so look at every undecided bridge once more
+        for e in range(len(bridges)):
+            if lo[e] < hi[e] and isolated(e):
+                lower_hi(e, hi[e] - 1)
+
+    fixed = {}
+    residual = []
+    domains = {}
+    for e, bridge in enumerate(bridges):
+        i, j, extra = bridge
+        if lo[e] < hi[e]:
+            residual.append(bridge)
+            domains[(i, j)] = (lo[e], hi[e])
+        elif lo[e] > 0:
+            fixed[(i, j)] = lo[e]
+    return fixed, residual, domains
+
+def residual_islands(islands, fixed):
+    """
+    The islands with what they still need once the fixed bridges are built.
+    """
+    degree = {id: 0 for id in islands.keys()}
+    for (i, j), count in fixed.items():
+        degree[i] += count
+        degree[j] += count
+    return {id: (r, c, req - degree[id]) for id, (r, c, req) in islands.items()}
+
+def add_domain_constraints(cnf, bridge_vars, domains):
+    """
+    Unit clauses for the undecided bridges whose domain was narrowed: lo = 1 -> x1, hi = 1 -> not x2.
+    """
+    for key, (lo, hi) in domains.items():
+        x1, x2 = bridge_vars[key]
+        if lo >= 1:
+            cnf.append([x1])
+        if hi <= 1:
+            cnf.append([-x2])
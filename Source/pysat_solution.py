@@ -1,34 +1,153 @@
-import time
-import tracemalloc
-from pysat.formula import CNF, IDPool
+import threading
 from pysat.solvers import Solver
-from helper import (
-    get_island_info, generate_bridge,
-    add_main_contraints, add_island_contraints, 
-    add_non_crossing_constraints, check_connect
-)
+from helper import ConnectivityChecker
+from encoding_cache import get_encoding
+from instrument import Profile, Budget, BudgetExceeded, run_search
 
-def solve_with_pysat(matrix):
-    tracemalloc.start()
-    start_time = time.perf_counter()
+def connectivity_cut(component, bridge_vars):
+    """
+    Build the cut clause for a disconnected component: at least one bridge must leave it.
+      Input: component (set of island ids), bridge_vars
+      Output: List of x1 literals of the bridges with exactly one end inside the component
+    """
+    return [x1 for (i, j), (x1, x2) in bridge_vars.items() if (i in component) != (j in component)]
 
-    islands = get_island_info(matrix)
-    bridges, coor_to_id = generate_bridge(islands, matrix)
+def blocking_clause(solution, bridge_vars):
+    """
+    Build the clause that rules out exactly one bridge assignment: some bridge must get another count.
+      Input: solution: {(island_id_1, island_id_2) -> count}, bridge_vars
+      Output: List of literals over every x1 and x2
+    """
+    clause = []
+    for key, (x1, x2) in bridge_vars.items():
+        count = solution.get(key, 0)
+        clause.append(-x1 if count >= 1 else x1)
+        clause.append(-x2 if count == 2 else x2)
+    return clause
 
-    cnf = CNF()
-    vpool = IDPool()
+def solve_with_pysat(matrix, connectivity_cuts=True, stats=None, profile=None, budget=None):
+    """
+    Solve Hashiwokakero with glucose3, repairing disconnected models lazily.
+      connectivity_cuts: True  -> add one cut per disconnected component (a bridge must leave it)
+                         False -> block the exact bridge assignment of the disconnected model
+      stats: optional dictionary, filled with 'status', 'iterations' (SAT calls), 'cuts' (clauses added)
+             and 'nodes' (conflicts of the SAT solver)
+      profile: optional instrument.Profile, filled with the time of each phase
+      budget: optional instrument.Budget, a new Budget() with the default limits when None
+    """
+    solutions, islands, bridges, elapsed, peak = enumerate_solutions(matrix, 1, connectivity_cuts, stats, profile, budget)
+    if solutions:
+        return solutions[0], islands, bridges, elapsed, peak
+    return None, None, None, elapsed, peak
 
-    bridge_vars = add_main_contraints(cnf, vpool, bridges)
-    add_island_contraints(cnf, vpool, islands, bridge_vars)
-    add_non_crossing_constraints(cnf, vpool, bridges)
+def enumerate_solutions(matrix, limit=None, connectivity_cuts=True, stats=None, profile=None, budget=None):
+    """
+    Enumerate the connected solutions of a puzzle with a single incremental solver.
+    After each solution, a clause blocking its whole x1/x2 assignment is added; the cuts learnt so far
+    stay valid for every connected solution and are kept, so each next solution costs about one more solve.
+    When the budget runs out, the solutions found so far are returned and stats['status'] tells why it stopped.
+      limit: stop after this many solutions, None for all of them
+      stats: optional dictionary, filled with 'status', 'iterations', 'cuts', 'nodes' and 'solutions'
+      Output: (solutions, islands, bridges, elapsed, peak), solutions: List of {(island_id_1, island_id_2) -> count}
+    """
+    if profile is None:
+        profile = Profile()
+    if budget is None:
+        budget = Budget()
+    profile.start()
+    budget.start()
 
-    solver = Solver(name='glucose3')
-    solver.append_formula(cnf)
+    if stats is None:
+        stats = {}
+    stats['iterations'] = 0
+    stats['cuts'] = 0
 
-    while solver.solve():
+    islands, bridges, bridge_vars, cnf, fixed = get_encoding(matrix, profile)
+    with profile.phase('encoding'):
+        solver = Solver(name='glucose3')
+        solver.append_formula(cnf)
+
+    solutions = []
+
+    def enumerate_all():
+        while limit is None or len(solutions) < limit:
+            solution = search(solver, islands, bridge_vars, fixed, connectivity_cuts, stats, profile, budget)
+            if solution is None:
+                break
+            solutions.append(solution)
+            if limit is None or len(solutions) < limit:
+                solver.add_clause(blocking_clause(solution, bridge_vars))
+        return solutions or None
+
+    with profile.phase('search'):
+        run_search(enumerate_all, budget, stats)
+    solver.delete()
+    stats['solutions'] = len(solutions)
+    profile.count_search(stats)
+
+    elapsed, peak = profile.stop()
+    return solutions, islands, bridges, elapsed, peak
+
+def check_unique(matrix, stats=None, profile=None, budget=None):
+    """
+    Tell whether a puzzle has no solution, exactly one, or several, by asking for at most 2 solutions.
+    Two solutions found are enough for 'multiple'; fewer only count when the search ran to its end.
+      Output: (status, solutions, islands, bridges, elapsed, peak), status is 'none', 'unique' or 'multiple',
+              or 'timeout' / 'memout' when the budget ran out first (solutions then holds what was found)
+    """
+    if stats is None:
+        stats = {}
+    solutions, islands, bridges, elapsed, peak = enumerate_solutions(matrix, 2, stats=stats, profile=profile, budget=budget)
+    if len(solutions) < 2 and stats['status'] in ('timeout', 'memout'):
+        status = stats['status']
+    else:
+        status = ['none', 'unique', 'multiple'][len(solutions)]
+    return status, solutions, islands, bridges, elapsed, peak
+
+def sat_call(solver, budget, assumptions=()):
+    """
+    One SAT call that stops with the budget: the conflicts left become the conflict budget of the call,
+    and a timer interrupts the solver at the deadline.
+      assumptions: literals that hold for this call only
+      Output: True or False, raises BudgetExceeded when the call was cut short
+    """
+    budget.check()
+    conflicts = solver.accum_stats()['conflicts']
+    if budget.node_limit is not None:
+        solver.conf_budget(max(1, budget.node_limit - budget.nodes))
+    remaining = budget.remaining()
+    timer = None
+    if remaining is not None:
+        timer = threading.Timer(remaining, solver.interrupt)
+        timer.start()
+    try:
+        result = solver.solve_limited(assumptions=assumptions, expect_interrupt=timer is not None)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    nodes = solver.accum_stats()['conflicts'] - conflicts
+    if result is None:
+        budget.step(nodes)
+        raise BudgetExceeded('timeout')
+    # A finished call keeps its answer even past the budget, the next call finds the budget spent
+    budget.nodes += nodes
+    return result
+
+def search(solver, islands, bridge_vars, fixed, connectivity_cuts, stats, profile, budget, assumptions=(), guard=None):
+    """
+    Solve, then add cuts (or blocking clauses) until a model is connected.
+    The fixed bridges are part of every model, so the cuts only use the undecided ones.
+    The cuts hold for every connected solution, so they stay valid for calls under other assumptions.
+      assumptions: literals the models must satisfy (a cube), without adding them to the solver
+      guard: literal that the cuts and blocking clauses depend on (they get -guard), for a solver shared
+             between puzzles where they do not hold; guard must then be in assumptions
+      Output: solution: {(island_id_1, island_id_2) -> count}, or None if there is no connected model
+    """
+    checker = ConnectivityChecker(islands)
+    while sat_call(solver, budget, assumptions):
+        stats['iterations'] += 1
         model = solver.get_model()
-        solution = {}
-        used_literals = []
+        solution = dict(fixed)
 
         for (i, j), (x1, x2) in bridge_vars.items():
             if model[x1 - 1] > 0:
@@ -36,19 +155,26 @@ def solve_with_pysat(matrix):
                 if model[x2 - 1] > 0:
                     count = 2
                 solution[(i, j)] = count
-                used_literals.append(x1)
 
-        if check_connect(solution, islands):
-            solver.delete()
-            elapsed = time.perf_counter() - start_time
-            current, peak = tracemalloc.get_traced_memory()
-            tracemalloc.stop()
-            return solution, islands, bridges, elapsed, peak / 1024
-        else:
-            solver.add_clause([-lit for lit in used_literals])
+        with profile.phase('connectivity'):
+            connected = checker.connected(solution)
+        if connected:
+            return solution
 
-    solver.delete()
-    elapsed = time.perf_counter() - start_time
-    current, peak = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
-    return None, None, None, elapsed, peak / 1024
\ No newline at end of file
+        guarded = [] if guard is None else [-guard]
+        if not connectivity_cuts:
+            solver.add_clause(guarded + blocking_clause(solution, bridge_vars))
+            stats['cuts'] += 1
+            continue
+
+        # With 2 components both cuts are the same clause, so only the smaller ones are needed
+        components = checker.components()
+        components.sort(key=len)
+        for component in components[:-1] if len(components) == 2 else components:
+            cut = connectivity_cut(component, bridge_vars)
+            if not cut:
+                # No bridge can ever leave this component: the puzzle cannot be connected
+                return None
+            solver.add_clause(guarded + cut)
+            stats['cuts'] += 1
+    return None
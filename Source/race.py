@@ -0,0 +1,72 @@
+import time
+from multiprocessing.connection import wait
+from helper import check_solution
+from batch import ChildProcess
+
+def _solve(func, matrix):
+    stats = {}
+    return func(matrix, stats=stats), stats['status']
+
+def solve_with_race(matrix, methods, timeout=None):
+    """
+    Run every solver in its own process and keep the first correct solution.
+    The solution is checked against the island numbers and check_connect before it is accepted.
+    All solvers are exhaustive, so the first one reporting "no solution" also ends the race,
+    unless it only stopped because its budget ran out.
+      Input: matrix, methods: list of (name, solve function), timeout in seconds (None = no limit)
+      Output: (winner name or None, solution, islands, bridges, reports)
+              reports: list of (name, status, seconds it ran), status in
+              'won', 'solved', 'no solution', 'invalid', 'error: ...', 'cancelled', 'timeout', 'memout'
+    """
+    start = time.perf_counter()
+    running = {}
+    for name, func in methods:
+        # The solvers already run side by side: cube and brute force get no pools of their own
+        child = ChildProcess(_solve, func, matrix, pool_workers=1)
+        running[child.conn] = (name, child)
+
+    reports = []
+    winner = None
+    result = (None, None, None)
+    decided = False
+    try:
+        while running and not decided:
+            remaining = None if timeout is None else max(0, start + timeout - time.perf_counter())
+            ready = wait(list(running), timeout=remaining)
+            if not ready:
+                break
+            for conn in ready:
+                name, child = running.pop(conn)
+                elapsed = time.perf_counter() - start
+                answer = child.result()
+
+                if isinstance(answer, Exception):
+                    reports.append((name, f'error: {answer}', elapsed))
+                    continue
+                (solution, islands, bridges, t, mem), search_status = answer
+                if search_status in ('timeout', 'memout'):
+                    reports.append((name, search_status, elapsed))
+                elif solution is None:
+                    reports.append((name, 'no solution', elapsed))
+                    decided = True
+                elif not check_solution(solution, islands):
+                    reports.append((name, 'invalid', elapsed))
+                elif decided:
+                    reports.append((name, 'solved', elapsed))
+                else:
+                    reports.append((name, 'won', elapsed))
+                    winner = name
+                    result = (solution, islands, bridges)
+                    decided = True
+    except BaseException:
+        # Ctrl-C: the children are in their own process groups and would keep running
+        for name, child in running.values():
+            child.kill()
+        raise
+
+    status = 'cancelled' if decided else 'timeout'
+    elapsed = time.perf_counter() - start
+    for name, child in running.values():
+        child.kill()
+        reports.append((name, status, elapsed))
+    return (winner, *result, reports)
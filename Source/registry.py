@@ -0,0 +1,127 @@
+import argparse
+import importlib
+import re
+import sys
+
+# Installed packages add solvers with an entry point in this group: name = 'module:function'.
+# The function takes the matrix and the keywords of the bundled solvers (profile, stats, budget).
+ENTRY_POINT_GROUP = 'hashi.solvers'
+
+class LazySolver:
+    """
+    A solve function named 'module:function', imported the first time it is called, so that choosing
+    one solver does not load the others, nor pysat when that solver does not need it.
+    """
+    def __init__(self, target):
+        self.target = target
+        self.module = target.split(':')[0]
+        self._func = None
+
+    def load(self):
+        if self._func is None:
+            module, function = self.target.split(':')
+            self._func = getattr(importlib.import_module(module), function)
+        return self._func
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+methods = {
+    "1": ("A*", LazySolver('a_start_solution:solve_with_a_star')),
+    "2": ("Backtracking", LazySolver('backtrack_solution:solve_with_back_track')),
+    "3": ("Brute-force", LazySolver('brute_force_solution:solve_with_brute_force')),
+    "4": ("pySAT", LazySolver('pysat_solution:solve_with_pysat')),
+    "6": ("Native", LazySolver('native_solution:solve_with_native')),
+    "9": ("Cube-and-conquer", LazySolver('cube_solution:solve_with_cubes')),
+}
+
+# Names accepted by --solver, besides the menu numbers
+method_names = {
+    "astar": "1",
+    "backtracking": "2",
+    "bruteforce": "3",
+    "pysat": "4",
+    "native": "6",
+    "cube": "9",
+}
+
+_entry_points_loaded = False
+
+def _normalize(name):
+    return name.lower().replace('-', '').replace('*', 'star')
+
+def register(name, target):
+    """
+    Add a solver, found by find_method under its name.
+      Input: name, target: 'module:function'
+    """
+    key = _normalize(name)
+    methods[key] = (name, LazySolver(target))
+    method_names[key] = key
+
+def load_entry_points():
+    """
+    Register the solvers of the ENTRY_POINT_GROUP entry points, once. A name already taken is skipped.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    # Imported here: importlib.metadata takes longer to import than everything else main needs
+    from importlib import metadata
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        if _normalize(entry_point.name) not in method_names:
+            register(entry_point.name, entry_point.value)
+
+def all_methods():
+    """
+    Every solver, the installed ones included: List of (name, function).
+    """
+    load_entry_points()
+    return list(methods.values())
+
+def find_method(name):
+    """
+    Get (name, function) for a menu number or a solver name, None if unknown.
+    The entry points are only looked at when the name is not a bundled solver.
+    """
+    if _normalize(name) not in method_names and name not in methods:
+        load_entry_points()
+    return methods.get(method_names.get(_normalize(name), name))
+
+def import_cost(module, top=5):
+    """
+    Cold import of one module in a new interpreter, measured with python -X importtime.
+      Output: (total seconds, List of (seconds, module) of the top slowest imports it pulls in, by own time)
+    """
+    import subprocess
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match is None:
+            continue
+        own, cumulative, indent, name = match.groups()
+        rows.append((int(own) / 1e6, name))
+        if name == module:
+            total = int(cumulative) / 1e6
+    rows.sort(reverse=True)
+    return total, rows[:top]
+
+def import_report(top=5):
+    """
+    Import cost of every solver, each in its own interpreter, like python -X importtime.
+    """
+    lines = [f"{'solver':<18} {'module':<22} {'import_ms':>9}  slowest imports (own ms)"]
+    for name, func in all_methods():
+        total, slowest = import_cost(func.module, top)
+        details = ', '.join(f'{module} {seconds * 1000:.0f}' for seconds, module in slowest)
+        lines.append(f"{name:<18} {func.module:<22} {total * 1000:>9.1f}  {details}")
+    return '\n'.join(lines) + '\n'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the cold import time of every registered solver.")
+    parser.add_argument('--top', type=int, default=5, help="slowest imports listed per solver")
+    print(import_report(parser.parse_args().top), end='')
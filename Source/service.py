@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from helper import render_result
+from batch import current_settings, apply_settings
+import instrument
+from instrument import Profile, percentile, solve_status
+from registry import find_method
+
+# Latencies kept for the percentiles of the 'stats' command
+LATENCY_WINDOW = 1000
+# Longest request line on a socket; a longer one is skipped and answered with an error
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+# What readline returns for a request line longer than MAX_REQUEST_BYTES
+TOO_LONG = object()
+# Solved by every worker at start-up, so the first real request does not pay for loading the SAT backend
+WARM_UP_PUZZLE = [[1, 0, 1]]
+
+def _warm_up(settings, solver):
+    apply_settings(settings)
+    name, func = find_method(solver)
+    func(WARM_UP_PUZZLE)
+
+def _ready():
+    return os.getpid()
+
+def _solve_in_worker(solver, matrix):
+    """
+    Solve one puzzle inside a pool worker.
+      Output: dictionary with status, bridges ([r1, c1, r2, c2, count]), grid (rows of print_result), solve_s,
+              phases, stats (counters of the search)
+    """
+    method = find_method(solver)
+    if method is None:
+        return {'status': f'error: unknown solver {solver}'}
+    name, func = method
+    profile = Profile()
+    stats = {}
+    solution, islands, bridges, t, mem = func(matrix, profile=profile, stats=stats)
+    answer = {'status': solve_status(stats), 'solver': name, 'solve_s': t, 'phases': profile.phases, 'stats': stats}
+    if solution is not None:
+        answer['bridges'] = [[*islands[i][:2], *islands[j][:2], count] for (i, j), count in solution.items()]
+        answer['grid'] = [' '.join(row) for row in render_result(matrix, islands, solution)]
+    return answer
+
+class SolverService:
+    """
+    A pool of worker processes that stay alive between requests, fed from one queue.
+    Each worker imports the solvers and warms the SAT backend once; its encoding cache also lives on
+    between requests, so a puzzle sent again skips the encoding.
+    The workers get the limits and other settings of this process when the pool starts.
+    """
+    def __init__(self, workers, solver='pysat'):
+        self.workers = workers
+        self.solver = solver
+        self.pool = None
+        self.queue = asyncio.Queue()
+        self.in_flight = 0
+        self.served = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._dispatchers = []
+
+    async def start(self):
+        # With several workers, a cube or brute force solve keeps to its worker process
+        settings = current_settings(pool_workers=1 if self.workers > 1 else None)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_warm_up, initargs=(settings, self.solver))
+        # Fork the workers now, warmed up, rather than on the first request: a worker forked while a client
+        # is connected keeps a copy of its socket, which then never closes
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _ready) for _ in range(self.workers)))
+        # One dispatcher per worker: the queue holds exactly the requests no worker has taken yet
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            received, solver, matrix, future = await self.queue.get()
+            waited = time.perf_counter() - received
+            self.in_flight += 1
+            try:
+                answer = await loop.run_in_executor(self.pool, _solve_in_worker, solver, matrix)
+            except Exception as e:
+                answer = {'status': f'error: {e}'}
+            finally:
+                self.in_flight -= 1
+            answer['queue_s'] = waited
+            future.set_result(answer)
+
+    async def solve(self, matrix, solver=None):
+        """
+        Queue one puzzle and wait for its answer.
+          Output: the worker answer plus queue_s (time waiting for a worker) and latency_s (time in the service)
+        """
+        received = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((received, solver or self.solver, matrix, future))
+        answer = await future
+        latency = time.perf_counter() - received
+        answer['latency_s'] = latency
+        self.latencies.append(latency)
+        self.served += 1
+        return answer
+
+    def stats(self):
+        stats = {
+            'status': 'ok',
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'in_flight': self.in_flight,
+            'served': self.served,
+        }
+        if self.latencies:
+            latencies = list(self.latencies)
+            stats['latency_p50_s'] = percentile(latencies, 50)
+            stats['latency_p95_s'] = percentile(latencies, 95)
+        return stats
+
+    async def handle(self, line):
+        """
+        Answer one JSON request line: {"matrix": [[...]], "solver": ..., "id": ...} or {"command": "stats"}.
+        The id, if any, is copied to the answer so a client can match answers sent out of order.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'status': f'error: bad JSON ({e})'}
+        if request.get('command') == 'stats':
+            answer = self.stats()
+        elif 'matrix' in request:
+            answer = await self.solve(request['matrix'], request.get('solver'))
+        else:
+            answer = {'status': 'error: expected "matrix" or "command"'}
+        if 'id' in request:
+            answer['id'] = request['id']
+        return answer
+
+async def _serve_stream(service, readline, write):
+    """
+    Read request lines until EOF and write each answer as soon as it is ready, possibly out of order.
+      Input: service, readline: coroutine function returning the next line ('' or b'' at EOF, TOO_LONG), write(text)
+    """
+    pending = set()
+
+    async def answer(line):
+        write(json.dumps(await service.handle(line)) + '\n')
+
+    while True:
+        line = await readline()
+        if line is TOO_LONG:
+            write(json.dumps({'status': f'error: request longer than {MAX_REQUEST_BYTES} bytes'}) + '\n')
+            continue
+        if not line:
+            break
+        if line.strip():
+            task = asyncio.create_task(answer(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+
+async def _skip_line(reader):
+    """
+    Drop the rest of the current line, however long, without holding it in memory.
+    """
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+        except asyncio.IncompleteReadError:
+            return
+
+async def serve_socket(service, host, port):
+    async def on_client(reader, writer):
+        async def readline():
+            try:
+                return await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # The last line without a newline, b'' at EOF
+                return e.partial
+            except asyncio.LimitOverrunError:
+                await _skip_line(reader)
+                return TOO_LONG
+
+        await _serve_stream(service, readline, lambda text: writer.write(text.encode()))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(on_client, host, port, limit=MAX_REQUEST_BYTES)
+    print(f"Listening on {host}:{port} with {service.workers} workers", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+async def serve_stdio(service):
+    loop = asyncio.get_running_loop()
+
+    # stdin may be a file or a console, which asyncio cannot watch everywhere: read it from a thread
+    async def readline():
+        return await loop.run_in_executor(None, sys.stdin.readline)
+
+    def write(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    await _serve_stream(service, readline, write)
+
+async def run(args):
+    # Every worker loads this solver at start-up, so an unknown one would break the whole pool
+    if find_method(args.solver) is None:
+        raise SystemExit(f"Unknown solver: {args.solver}")
+    # Given to the workers by SolverService.start
+    instrument.TIME_LIMIT = args.time_limit
+    instrument.NODE_LIMIT = args.node_limit
+    instrument.MEMORY_LIMIT = args.memory_limit
+    service = SolverService(args.workers, args.solver)
+    await service.start()
+    try:
+        if args.stdio:
+            await serve_stdio(service)
+        else:
+            await serve_socket(service, args.host, args.port)
+    finally:
+        await service.stop()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve Hashiwokakero solves over a socket or stdin, one JSON request per line.")
+    parser.add_argument('--stdio', action='store_true', help="read requests from stdin and answer on stdout instead of a socket")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="solver processes kept warm")
+    parser.add_argument('--solver', default='pysat', help="default solver of the requests (default: pysat)")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds per request before the answer is 'timeout'")
+    parser.add_argument('--node-limit', type=int, default=None, help="search nodes per request before the answer is 'timeout'")
+    parser.add_argument('--memory-limit', type=float, default=None, help="KB of memory a solve may add before the answer is 'memout'")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        pass
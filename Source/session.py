@@ -0,0 +1,230 @@
+from pysat.formula import IDPool
+from pysat.solvers import Solver
+import helper
+from helper import get_island_info, generate_bridge, get_crossing_pairs, island_clauses
+from pysat_solution import search
+from instrument import Profile, Budget, run_search
+
+def crosses(extra_1, extra_2):
+    """
+    Whether two bridges, given by the extra of generate_bridge, cross each other.
+    """
+    if extra_1[0] == extra_2[0]:
+        return False
+    if extra_1[0] == 'vertical':
+        extra_1, extra_2 = extra_2, extra_1
+    kind, r, c_start, c_end = extra_1
+    kind, c, r_start, r_end = extra_2
+    return r_start < r < r_end and c_start < c < c_end
+
+class PuzzleSession:
+    """
+    A puzzle that is edited and solved again and again, with one glucose3 solver kept alive in between.
+    Bridges are keyed by the positions of their islands, so their variables and crossing clauses survive
+    the edits. Each island requirement is encoded once per (island, requirement, bridges) behind a
+    selector literal. A solve assumes the selectors of the current islands and -x1 for every bridge
+    the current grid does not have.
+    The connectivity cuts depend on which islands exist, so they are guarded by a selector of the layout:
+    after changing a number, or when a layout comes back, the cuts found before still apply.
+    The solver keeps its learnt clauses across edits.
+    Island ids are given on first sight and kept across edits, so they differ from get_island_info
+    once islands are added.
+    """
+    def __init__(self, matrix, encoding=None):
+        self.matrix = [list(row) for row in matrix]
+        self.encoding = helper.CARD_ENCODING if encoding is None else encoding
+        self.vpool = IDPool()
+        self.solver = Solver(name='glucose3')
+        # position -> island id, and the current islands, bridges and bridge_vars like the solvers use them
+        self.ids = {}
+        self.islands = {}
+        self.bridges = {}
+        self.bridge_vars = {}
+        # Every bridge ever seen, by positions: -> (x1, x2) and -> extra ('horizontal', r, c1, c2) ...
+        self._vars = {}
+        self._geometry = {}
+        # Bridges seen but not in the current grid, assumed -x1
+        self._inactive = set()
+        self._incident = {}
+        # Islands whose selector must be looked up again, and the current selectors
+        self._dirty = set()
+        self._assumed = {}
+        self._selectors = {}
+        self._layout = None
+
+        islands = get_island_info(self.matrix)
+        bridges, coord_to_id = generate_bridge(islands, self.matrix)
+        for id, (r, c, req) in islands.items():
+            self._add_position((r, c))
+        keys = [(islands[i][:2], islands[j][:2]) for i, j, extra in bridges]
+        for key, (i, j, extra) in zip(keys, bridges):
+            self._new_bridge(key, extra, cross=False)
+            self._link(*key)
+        for e, f in get_crossing_pairs(bridges):
+            self.solver.add_clause([-self._vars[keys[e]][0], -self._vars[keys[f]][0]])
+
+    def _add_position(self, p):
+        if p not in self.ids:
+            self.ids[p] = len(self.ids) + 1
+        self.islands[self.ids[p]] = (*p, self.matrix[p[0]][p[1]])
+        self._incident[p] = set()
+        self._dirty.add(p)
+        self._layout = None
+
+    def _remove_position(self, p):
+        del self.islands[self.ids[p]]
+        del self._incident[p]
+        self._dirty.discard(p)
+        self._assumed.pop(p, None)
+        self._layout = None
+
+    def _new_bridge(self, key, extra, cross=True):
+        """
+        Variables of a bridge seen for the first time, with its crossing clauses against every bridge seen so far.
+        """
+        x1 = self.vpool.id(('x', key, 1))
+        x2 = self.vpool.id(('x', key, 2))
+        self.solver.add_clause([-x2, x1])
+        if cross:
+            for other, other_extra in self._geometry.items():
+                if crosses(extra, other_extra):
+                    self.solver.add_clause([-x1, -self._vars[other][0]])
+        self._vars[key] = (x1, x2)
+        self._geometry[key] = extra
+
+    def _id_pair(self, p, q):
+        """
+        Ids of the islands at p and q, smallest first like the keys of generate_bridge.
+        """
+        return tuple(sorted((self.ids[p], self.ids[q])))
+
+    def _link(self, p, q):
+        """
+        Make p - q a bridge of the current grid (p before q on the same row or column).
+        """
+        key = (p, q)
+        if key not in self._vars:
+            if p[0] == q[0]:
+                extra = ('horizontal', p[0], p[1], q[1])
+            else:
+                extra = ('vertical', p[1], p[0], q[0])
+            self._new_bridge(key, extra)
+        self._inactive.discard(key)
+        self.bridges[key] = self._geometry[key]
+        self.bridge_vars[self._id_pair(p, q)] = self._vars[key]
+        for end in key:
+            self._incident[end].add(key)
+            self._dirty.add(end)
+
+    def _unlink(self, p, q):
+        key = (p, q)
+        if key not in self.bridges:
+            return
+        self._inactive.add(key)
+        del self.bridges[key]
+        del self.bridge_vars[self._id_pair(p, q)]
+        for end in key:
+            self._incident[end].discard(key)
+            self._dirty.add(end)
+
+    def _nearest(self, r, c, dr, dc):
+        """
+        Position of the first island from (r, c) in the direction (dr, dc), None if there is none.
+        """
+        r, c = r + dr, c + dc
+        while 0 <= r < len(self.matrix) and 0 <= c < len(self.matrix[0]):
+            if self.matrix[r][c]:
+                return (r, c)
+            r, c = r + dr, c + dc
+        return None
+
+    def set_island(self, r, c, require):
+        """
+        Set the number of the cell (r, c): 0 removes the island, a number on an empty cell adds one.
+        Only the bridges on row r and column c change; the solver learns nothing new until the next solve.
+        """
+        if not 0 <= require <= 8:
+            raise ValueError(f"a cell holds 0 (no island) to 8 bridges, got {require}")
+        old = self.matrix[r][c]
+        self.matrix[r][c] = require
+        p = (r, c)
+        if (old == 0) == (require == 0):
+            if require:
+                self.islands[self.ids[p]] = (r, c, require)
+                self._dirty.add(p)
+            return
+        neighbours = ((self._nearest(r, c, 0, -1), self._nearest(r, c, 0, 1)),
+                      (self._nearest(r, c, -1, 0), self._nearest(r, c, 1, 0)))
+        if require:
+            self._add_position(p)
+        for before, after in neighbours:
+            if require:
+                if before and after:
+                    self._unlink(before, after)
+                if before:
+                    self._link(before, p)
+                if after:
+                    self._link(p, after)
+            else:
+                if before:
+                    self._unlink(before, p)
+                if after:
+                    self._unlink(p, after)
+                if before and after:
+                    self._link(before, after)
+        if not require:
+            self._remove_position(p)
+
+    def _island_selector(self, p):
+        """
+        Selector of the requirement of island p over its current bridges, encoded the first time it is needed.
+        """
+        keys = tuple(sorted(self._incident[p]))
+        key = ('island', p, self.matrix[p[0]][p[1]], keys)
+        if key not in self._selectors:
+            selector = self.vpool.id(key)
+            lits = [x for bridge in keys for x in self._vars[bridge]]
+            for clause in island_clauses(self.vpool, lits, key[2], self.encoding):
+                self.solver.add_clause([-selector] + clause)
+            self._selectors[key] = selector
+        return self._selectors[key]
+
+    def solve(self, stats=None, profile=None, budget=None):
+        """
+        Solve the current grid with everything the solver learnt on the earlier ones.
+          stats: optional dictionary, filled with 'status', 'nodes' (conflicts of this solve), 'iterations' and 'cuts'
+          Output: (solution, islands, bridges, elapsed, peak) like the solvers, with the island ids of self.ids
+        """
+        if profile is None:
+            profile = Profile()
+        if stats is None:
+            stats = {}
+        if budget is None:
+            budget = Budget()
+        profile.start()
+        budget.start()
+        stats['iterations'] = 0
+        stats['cuts'] = 0
+
+        with profile.phase('encoding'):
+            for p in self._dirty:
+                self._assumed[p] = self._island_selector(p)
+            self._dirty.clear()
+            if self._layout is None:
+                self._layout = self.vpool.id(('layout', frozenset(self._incident)))
+            assumptions = [self._layout, *self._assumed.values()]
+            assumptions.extend(-self._vars[key][0] for key in self._inactive)
+
+        with profile.phase('search'):
+            solution = run_search(lambda: search(self.solver, self.islands, self.bridge_vars, {}, True, stats, profile,
+                                                 budget, assumptions, guard=self._layout), budget, stats)
+        profile.count_search(stats)
+
+        elapsed, peak = profile.stop()
+        if solution is not None:
+            bridges = [(*self._id_pair(p, q), extra) for (p, q), extra in self.bridges.items()]
+            return solution, dict(self.islands), bridges, elapsed, peak
+        return None, None, None, elapsed, peak
+
+    def close(self):
+        self.solver.delete()
@@ -0,0 +1,267 @@
+import argparse
+import numpy as np
+from helper import get_island_info, generate_bridge, get_crossing_pairs, ConnectivityChecker
+from corpus import MAGIC, SYMBOL_CODES, open_corpus, parse_puzzle, parse_solution
+
+# Rules checked on a solution grid, in the order they are reported: a grid gets the first rule it breaks.
+# 'unverifiable' is not a failure: the grid cannot tell whether the solution is valid
+RULES = ('ok', 'shape', 'islands', 'bridge_end', 'bridge_limit', 'crossing', 'unverifiable', 'degree', 'connected')
+FAILURES = tuple(rule for rule in RULES if rule not in ('ok', 'unverifiable'))
+RULE_MESSAGES = {
+    'ok': "valid solution",
+    'shape': "the solution grid does not have the size of the puzzle",
+    'islands': "the islands of the solution differ from the puzzle (missing, moved, changed or covered by a bridge)",
+    'bridge_end': "a bridge does not join two islands (it ends on water or at the border)",
+    'bridge_limit': "a bridge is not 1 or 2 bridges along its whole length",
+    'crossing': "two bridges cross",
+    'unverifiable': "two islands touch, so the grid cannot show the bridges between them: check the dictionary with verify_solution",
+    'degree': "an island does not get its number of bridges",
+    'connected': "the islands are not all connected",
+}
+# Grids verified together by verify_corpus
+BATCH_GRIDS = 4096
+
+H1, H2, V1, V2 = (SYMBOL_CODES[symbol] for symbol in '-=|$')
+# What a cell is, by symbol code: water (or an unknown symbol), island, horizontal or vertical bridge
+WATER, ISLAND, HORIZONTAL, VERTICAL = range(4)
+_KIND = np.zeros(256, dtype=np.uint8)
+_KIND[1:9] = ISLAND
+_KIND[[H1, H2, V1, V2]] = (HORIZONTAL, HORIZONTAL, VERTICAL, VERTICAL)
+# Bridges that a cell holds in the horizontal and the vertical direction, by symbol code
+_HORIZONTAL = np.zeros(256, dtype=np.uint8)
+_HORIZONTAL[[H1, H2]] = (1, 2)
+_VERTICAL = np.zeros(256, dtype=np.uint8)
+_VERTICAL[[V1, V2]] = (1, 2)
+
+def pad_grids(grids):
+    """
+    Stack grids of any sizes into one (n, rows + 2, cols + 2) uint8 array, each grid in the top-left corner
+    of a border of 0 (water), so every cell has 4 neighbours and no bridge runs into the next grid.
+    """
+    grids = [np.asarray(grid, dtype=np.uint8) for grid in grids]
+    rows = max((grid.shape[0] for grid in grids), default=0)
+    cols = max((grid.shape[1] for grid in grids), default=0)
+    batch = np.zeros((len(grids), rows + 2, cols + 2), dtype=np.uint8)
+    for k, grid in enumerate(grids):
+        batch[k, 1:grid.shape[0] + 1, 1:grid.shape[1] + 1] = grid
+    return batch
+
+def component_labels(n_nodes, u, v):
+    """
+    Connected components of a graph on n_nodes nodes, for every graph of the batch at once: the edge
+    u[e] - v[e] hooks the larger root onto the smaller one, then pointer jumping flattens the trees.
+    Only the edges between two components are kept for the next round.
+      Output: int array, the smallest node of its component for every node
+    """
+    labels = np.arange(n_nodes)
+    while len(u):
+        lu, lv = labels[u], labels[v]
+        apart = lu != lv
+        u, v, lu, lv = u[apart], v[apart], lu[apart], lv[apart]
+        np.minimum.at(labels, np.maximum(lu, lv), np.minimum(lu, lv))
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    return labels
+
+def rule_masks(puzzles, solutions):
+    """
+    The cells breaking each rule, for a batch of padded puzzles and solution grids of the same shape.
+      Output: {rule -> (n, rows, cols) bool array over the cells inside the border}
+    """
+    n, rows, cols = puzzles.shape
+    inner = (slice(None), slice(1, -1), slice(1, -1))
+    is_island = puzzles > 0
+    kind = _KIND[solutions]
+    horizontal = _HORIZONTAL[solutions]
+    vertical = _VERTICAL[solutions]
+    masks = {}
+    masks['islands'] = (is_island & (solutions != puzzles)) | (~is_island & (kind == ISLAND)) | (solutions > V2)
+
+    left = (slice(None), slice(1, -1), slice(0, -2))
+    right = (slice(None), slice(1, -1), slice(2, None))
+    up = (slice(None), slice(0, -2), slice(1, -1))
+    down = (slice(None), slice(2, None), slice(1, -1))
+    # A bridge cell goes on with the same symbol or reaches an island on both sides along its direction
+    masks['bridge_end'] = masks['bridge_limit'] = masks['crossing'] = False
+    cell = solutions[inner]
+    for direction, across, sides in ((HORIZONTAL, VERTICAL, (left, right)), (VERTICAL, HORIZONTAL, (up, down))):
+        bridge = kind[inner] == direction
+        for side in sides:
+            neighbour = kind[side]
+            broken = bridge & (solutions[side] != cell) & (neighbour != ISLAND)
+            masks['bridge_limit'] = masks['bridge_limit'] | (broken & (neighbour == direction))
+            masks['crossing'] = masks['crossing'] | (broken & (neighbour == across))
+            masks['bridge_end'] = masks['bridge_end'] | (broken & (neighbour == WATER))
+    masks['unverifiable'] = is_island[inner] & (is_island[right] | is_island[down])
+
+    degree = horizontal[left] + horizontal[right] + vertical[up] + vertical[down]
+    masks['degree'] = is_island[inner] & (degree != puzzles[inner])
+
+    # One edge per bridge, from the island where it starts to the nearest island after it on its line
+    flat = np.arange(n * rows * cols).reshape(n, rows, cols)
+    after = np.where(is_island, flat, n * rows * cols)
+    after_h = np.minimum.accumulate(after[:, :, ::-1], axis=2)[:, :, ::-1]
+    after_v = np.minimum.accumulate(after[:, ::-1, :], axis=1)[:, ::-1, :]
+    start_h = is_island[:, :, :-1] & (kind[:, :, 1:] == HORIZONTAL)
+    start_v = is_island[:, :-1, :] & (kind[:, 1:, :] == VERTICAL)
+    u = np.concatenate((flat[:, :, :-1][start_h], flat[:, :-1, :][start_v]))
+    v = np.concatenate((after_h[:, :, 1:][start_h], after_v[:, 1:, :][start_v]))
+    # The islands are numbered in row-major order across the batch; a bridge to nowhere joins nothing
+    rank = np.cumsum(is_island.ravel()) - 1
+    joins = v < n * rows * cols
+    labels = component_labels(int(rank[-1]) + 1 if rank.size else 0, rank[u[joins]], rank[v[joins]])
+    # Every island must get the label of the first island of its grid
+    island_labels = np.full(n * rows * cols, -1)
+    island_labels[is_island.ravel()] = labels
+    island_labels = island_labels.reshape(n, rows, cols)
+    first = is_island.reshape(n, -1).argmax(axis=1)
+    reference = island_labels.reshape(n, -1)[np.arange(n), first]
+    masks['connected'] = (is_island & (island_labels != reference[:, None, None]))[inner]
+
+    masks['islands'] = masks['islands'][inner]
+    return masks
+
+def verify_batch(puzzles, solutions):
+    """
+    Verify padded puzzles against padded solution grids (pad_grids), all the checks vectorized over the batch.
+      Output: (rules, cells): rules is an int array of indices into RULES, 0 for a valid solution,
+              cells an (n, 2) int array with the first cell (row, col) breaking that rule, -1 when valid
+    """
+    n, rows, cols = puzzles.shape
+    masks = rule_masks(puzzles, solutions)
+    rules = np.zeros(n, dtype=np.int64)
+    cells = np.full((n, 2), -1, dtype=np.int64)
+    # The last rule first, so the first rule a grid breaks is the one kept
+    for index in range(len(RULES) - 1, 1, -1):
+        mask = masks[RULES[index]].reshape(n, -1)
+        broken = mask.any(axis=1)
+        first = mask.argmax(axis=1)
+        rules[broken] = index
+        cells[broken, 0] = first[broken] // (cols - 2)
+        cells[broken, 1] = first[broken] % (cols - 2)
+    return rules, cells
+
+def verify_grids(puzzles, solutions):
+    """
+    Verify print_result solution grids, as arrays of symbol codes (corpus.parse_solution), against their puzzles.
+      Input: puzzles, solutions: sequences of 2D arrays or lists, of any sizes
+      Output: (rules, cells) like verify_batch
+    """
+    puzzles = [np.asarray(puzzle, dtype=np.uint8) for puzzle in puzzles]
+    solutions = [np.asarray(solution, dtype=np.uint8) for solution in solutions]
+    if len(puzzles) != len(solutions):
+        raise ValueError(f"{len(puzzles)} puzzles for {len(solutions)} solutions")
+    same = np.array([p.shape == s.shape for p, s in zip(puzzles, solutions)], dtype=bool)
+    rules = np.full(len(puzzles), RULES.index('shape'), dtype=np.int64)
+    cells = np.full((len(puzzles), 2), -1, dtype=np.int64)
+    keep = np.flatnonzero(same)
+    if len(keep):
+        rules[keep], cells[keep] = verify_batch(pad_grids([puzzles[k] for k in keep]),
+                                                pad_grids([solutions[k] for k in keep]))
+    return rules, cells
+
+def verify_solution(matrix, solution, islands=None):
+    """
+    Verify a solution dictionary {(island_id_1, island_id_2) -> count} without solving anything.
+    Unlike a grid, the dictionary also holds the bridges between two islands that touch.
+      Input: islands: the islands the ids refer to, get_island_info(matrix) when None
+      Output: (rule, cell): a name from RULES, and the (row, col) of an island breaking it (None when valid)
+    """
+    if islands is None:
+        islands = get_island_info(matrix)
+    def at(id):
+        return tuple(islands[id][:2]) if id in islands else None
+
+    bridges, coord_to_id = generate_bridge(islands, matrix)
+    possible = {(i, j): extra for i, j, extra in bridges}
+    built = []
+    for (i, j), count in solution.items():
+        if count not in (1, 2):
+            return 'bridge_limit', at(i)
+        key = (min(i, j), max(i, j))
+        if key not in possible:
+            return 'bridge_end', at(i)
+        built.append((*key, possible[key]))
+    for e, f in get_crossing_pairs(built):
+        return 'crossing', at(built[e][0])
+
+    degree = {id: 0 for id in islands.keys()}
+    for (i, j), count in solution.items():
+        degree[i] += count
+        degree[j] += count
+    for id, (r, c, req) in islands.items():
+        if degree[id] != req:
+            return 'degree', (r, c)
+
+    checker = ConnectivityChecker(islands)
+    if checker.count(solution) > 1:
+        first = checker.find(checker.ids[0])
+        return 'connected', next(at(id) for id in checker.ids if checker.find(id) != first)
+    return 'ok', None
+
+def verify_corpus(puzzle_file, solution_file, batch=BATCH_GRIDS):
+    """
+    Verify a corpus of solution grids against the corpus of their puzzles, batch grids at a time.
+      Output: (rules, cells) like verify_batch, one entry per grid
+    """
+    puzzle_data, puzzle_index = open_corpus(puzzle_file)
+    solution_data, solution_index = open_corpus(solution_file)
+    if len(puzzle_index) != len(solution_index):
+        raise ValueError(f"{len(puzzle_index)} puzzles for {len(solution_index)} solutions")
+    # Plain views of the memory maps: slicing a memmap costs more than the checks of a small grid
+    puzzle_data, solution_data = np.asarray(puzzle_data), np.asarray(solution_data)
+
+    def grids(data, index):
+        return [data[offset:offset + rows * cols].reshape(rows, cols) for offset, rows, cols in index.tolist()]
+
+    all_rules, all_cells = [], []
+    for start in range(0, len(puzzle_index), batch):
+        rules, cells = verify_grids(grids(puzzle_data, puzzle_index[start:start + batch]),
+                                    grids(solution_data, solution_index[start:start + batch]))
+        all_rules.append(rules)
+        all_cells.append(cells)
+    if not all_rules:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2), dtype=np.int64)
+    return np.concatenate(all_rules), np.concatenate(all_cells)
+
+def is_corpus(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def format_report(rules, cells, show=10):
+    """
+    Count of grids per rule and of failures, then the first failures and the first unverifiable grids with their cell.
+    """
+    counts = np.bincount(rules, minlength=len(RULES))
+    lines = [f"{rule:<13} {count:>9}" for rule, count in zip(RULES, counts.tolist()) if count]
+    failed = np.isin(rules, [RULES.index(rule) for rule in FAILURES])
+    lines.append(f"{'failed':<13} {int(failed.sum()):>9}")
+    unverifiable = rules == RULES.index('unverifiable')
+    for k in np.flatnonzero(failed)[:show].tolist() + np.flatnonzero(unverifiable)[:show].tolist():
+        rule = RULES[rules[k]]
+        lines.append(f"grid {k + 1}: {rule} at {tuple(cells[k].tolist())}: {RULE_MESSAGES[rule]}")
+    return '\n'.join(lines) + '\n'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check solution grids against their puzzles without solving them.")
+    parser.add_argument('puzzles', help="packed corpus of puzzles, or one puzzle file")
+    parser.add_argument('solutions', help="packed corpus of print_result grids, or one output file")
+    parser.add_argument('--show', type=int, default=10, help="failures (and unverifiable grids) listed with their cell")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if is_corpus(args.puzzles):
+        rules, cells = verify_corpus(args.puzzles, args.solutions)
+    else:
+        with open(args.puzzles) as f, open(args.solutions) as g:
+            puzzle, text = parse_puzzle(f.read()), g.read()
+        try:
+            solution = parse_solution(text)
+        except ValueError:
+            raise SystemExit(f"{args.solutions} is not a solution grid: {text.strip().splitlines()[-1] if text.strip() else 'empty'}")
+        rules, cells = verify_grids([puzzle], [solution])
+    print(format_report(rules, cells, args.show), end='')